@@ -1,14 +1,19 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
 from django.contrib.auth.admin import UserAdmin
 from .models import User, Business, Product
+from .admin_mixins import LargeTableAdminMixin, BusinessInputFilter, ShardFilter, ShardedChangeList
+from .sharding import is_sharded, shard_for_business, sharded
 
 
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, UserAdmin):
     list_display = ('username', 'email', 'business', 'role', 'is_active')
-    list_filter = ('role', 'business', 'is_active')
+    list_filter = ('role', BusinessInputFilter, 'is_active')
+    list_select_related = ('business',)
+    autocomplete_fields = ('business',)
     search_fields = ('username', 'email')
     ordering = ('username',)
 
@@ -28,9 +33,12 @@ class BusinessAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'price', 'status', 'business', 'created_by', 'created_at', 'image_preview')
-    list_filter = ('status', 'business', 'created_at')
+    list_filter = ('status', BusinessInputFilter)
+    list_select_related = ('business', 'created_by')
+    autocomplete_fields = ('business', 'created_by')
+    date_hierarchy = 'created_at'
     search_fields = ('name', 'description')
     ordering = ('-created_at',)
     readonly_fields = ('image_preview',)
@@ -44,6 +52,33 @@ class ProductAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if request.user.is_superuser or request.user.role == 'admin':
+        if self.sees_all_shards(request):
             return qs
-        return qs.filter(business=request.user.business)
+        return qs.using(shard_for_business(request.user.business_id)).filter(business=request.user.business)
+
+    def sees_all_shards(self, request):
+        return request.user.is_superuser or request.user.role == 'admin'
+
+    def get_list_filter(self, request):
+        if is_sharded() and self.sees_all_shards(request):
+            return (*self.list_filter, ShardFilter)
+        return self.list_filter
+
+    def get_changelist(self, request, **kwargs):
+        if self.sees_all_shards(request):
+            return ShardedChangeList
+        return super().get_changelist(request, **kwargs)
+
+    def get_object(self, request, object_id, from_field=None):
+        if not (is_sharded() and self.sees_all_shards(request)) or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        try:
+            return sharded(self.get_queryset(request)).get(pk=object_id)
+        except (Product.DoesNotExist, ValueError, ValidationError):
+            return None
+
+    def get_actions(self, request):
+        # A bulk action runs on one queryset, so it needs a single shard picked
+        if is_sharded() and self.sees_all_shards(request) and not request.GET.get(ShardFilter.parameter_name):
+            return {}
+        return super().get_actions(request)
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from product_marketplace.conf import setting_getter
+from .models import Product
+from .sharding import get_shards, sharded
+
+DEFAULTS = {
+    'LEASE_SECONDS': 600,
+    'MAX_CLAIM': 50,
+    'CLAIM_ATTEMPTS': 3,
+}
+
+get_approval_setting = setting_getter('APPROVAL_QUEUE', DEFAULTS)
+
+
+def lease_cutoff(now=None):
+    """Claims made before this moment have expired."""
+    return (now or timezone.now()) - timedelta(seconds=get_approval_setting('LEASE_SECONDS'))
+
+
+def lease_expires_at(claimed_at):
+    return claimed_at + timedelta(seconds=get_approval_setting('LEASE_SECONDS'))
+
+
+def unclaimed(cutoff):
+    return Q(status='pending_approval') & (Q(claimed_at__isnull=True) | Q(claimed_at__lt=cutoff))
+
+
+def claimed_by_others(user, cutoff=None):
+    """Products another approver holds a live lease on."""
+    return Q(claimed_at__gte=cutoff or lease_cutoff()) & ~Q(claimed_by_id=user.pk)
+
+
+def claim_products(user, count):
+    """
+    Claim up to ``count`` of the oldest unclaimed pending products for ``user``.
+
+    Candidates are picked across shards by age. The claiming UPDATE is
+    conditional on the product still being unclaimed, so concurrent
+    approvers never claim the same product; losers of a race retry with
+    fresh candidates. Returns the claimed products, oldest first.
+    """
+    now = timezone.now()
+    cutoff = lease_cutoff(now)
+    claimed = 0
+    for _ in range(get_approval_setting('CLAIM_ATTEMPTS')):
+        wanted = count - claimed
+        candidates = []
+        for shard in get_shards():
+            rows = (
+                Product.objects.using(shard)
+                .filter(unclaimed(cutoff))
+                .order_by('created_at', 'pk')
+                .values_list('created_at', 'pk')[:wanted]
+            )
+            candidates.extend((created_at, pk, shard) for created_at, pk in rows)
+        if not candidates:
+            break
+        candidates = sorted(candidates)[:wanted]
+
+        for shard in {shard for _, _, shard in candidates}:
+            ids = [pk for _, pk, candidate_shard in candidates if candidate_shard == shard]
+            with transaction.atomic(using=shard):
+                free = (
+                    Product.objects.using(shard).select_for_update(skip_locked=True)
+                    .filter(unclaimed(cutoff), pk__in=ids)
+                    .values_list('pk', flat=True)
+                )
+                # A claim is not an edit, so updated_at (the content version) stays put
+                claimed += Product.objects.using(shard).filter(unclaimed(cutoff), pk__in=list(free)).update(
+                    claimed_by=user, claimed_at=now, updated_at=F('updated_at')
+                )
+        if claimed >= count:
+            break
+    claimed = Product.objects.filter(claimed_by=user, claimed_at=now).select_related('created_by', 'business')
+    return list(sharded(claimed).order_by('created_at'))
+
+
+def approve_product(user, product):
+    """
+    Approve ``product`` unless another approver holds a live claim on it.
+
+    The approval is one UPDATE conditional on the product still pending and
+    unclaimed, claimed by ``user`` or past its lease, so it cannot race a
+    claim. Returns False when that condition no longer holds.
+    """
+    now = timezone.now()
+    using = product._state.db
+    pending = Product.objects.using(using).filter(
+        Q(claimed_by__isnull=True) | Q(claimed_by=user) | Q(claimed_at__lt=lease_cutoff(now)),
+        pk=product.pk, status='pending_approval',
+    )
+    # The plain QuerySet.update: post_save below writes the change log entry
+    if not models.QuerySet.update(pending, status='approved', claimed_by=None, claimed_at=None, updated_at=now):
+        return False
+    product.status, product.claimed_by, product.claimed_at, product.updated_at = 'approved', None, None, now
+    # Caches, the related index and the change log follow post_save, which an UPDATE does not send
+    post_save.send(
+        sender=Product, instance=product, created=False, raw=False, using=using,
+        update_fields=frozenset({'status', 'claimed_by', 'claimed_at', 'updated_at'}),
+    )
+    return True
+
+
+def release_claim(user, product):
+    """Give up ``user``'s claim on ``product``. Returns False if they did not hold it."""
+    released = Product.objects.using(product._state.db).filter(pk=product.pk, claimed_by=user).update(
+        claimed_by=None, claimed_at=None, updated_at=F('updated_at')
+    )
+    return released > 0
@@ -0,0 +1,12 @@
+from rest_framework import authentication
+
+
+class BatchSubRequestAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticate batch sub-requests as the batch's user. Only requests built
+    by ``api.batch.build_subrequest`` carry ``batch_auth``; anything else
+    falls through to the other authentication classes.
+    """
+
+    def authenticate(self, request):
+        return getattr(request._request, 'batch_auth', None)
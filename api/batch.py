@@ -0,0 +1,171 @@
+import contextvars
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from product_marketplace.conf import setting_getter
+from .deadlines import EXCEEDED_DETAIL, UNNAMED, DeadlineExceeded, budget_for, deadline, get_deadline_setting
+from .serializers import BatchSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_REQUESTS': 20,
+    'MAX_WORKERS': 4,
+    'ALLOWED_PREFIXES': [
+        '/api/businesses/',
+        '/api/users/',
+        '/api/products/',
+        '/api/public/products/',
+        '/api/chat/history/',
+    ],
+    # Streaming endpoints can't be answered inside a batch
+    'EXCLUDED_PATHS': ['/api/products/events/'],
+}
+
+get_batch_setting = setting_getter('API_BATCH', DEFAULTS)
+
+
+def is_allowed(path):
+    if '..' in path or path in get_batch_setting('EXCLUDED_PATHS'):
+        return False
+    return any(path.startswith(prefix) for prefix in get_batch_setting('ALLOWED_PREFIXES'))
+
+
+def build_subrequest(request, method, path, query, body):
+    """
+    An HttpRequest for one sub-request, carrying the batch's authenticated
+    user for api.authentication.BatchSubRequestAuthentication.
+    """
+    subrequest = HttpRequest()
+    subrequest.method = method
+    subrequest.path = subrequest.path_info = path
+    subrequest.META = {
+        key: value for key, value in request.META.items()
+        if key not in ('HTTP_AUTHORIZATION', 'CONTENT_TYPE', 'CONTENT_LENGTH')
+    }
+    subrequest.META.update({'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query})
+    subrequest.GET = QueryDict(query)
+    subrequest.COOKIES = request.COOKIES
+    if body is not None:
+        payload = json.dumps(body).encode()
+        subrequest.META.update({'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(payload))})
+        subrequest._stream = io.BytesIO(payload)
+        subrequest._read_started = False
+    subrequest.user = request.user
+    subrequest.batch_auth = (request.user, request.auth)
+    return subrequest
+
+
+def response_body(response):
+    data = getattr(response, 'data', None)
+    if data is not None or response.status_code == status.HTTP_204_NO_CONTENT:
+        return data
+    if response.streaming:
+        return None
+    content_type = response.get('Content-Type', '')
+    content = response.content.decode(response.charset or 'utf-8')
+    return json.loads(content) if content_type.startswith('application/json') and content else content
+
+
+def execute(request, item):
+    """Run one sub-request in-process and return its result entry."""
+    entry = {'id': item.get('id'), 'status': None, 'body': None}
+    url = urlsplit(item['path'])
+    if not is_allowed(url.path):
+        entry.update(status=status.HTTP_403_FORBIDDEN, body={'detail': 'This path cannot be used in a batch.'})
+        return entry
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        entry.update(status=status.HTTP_404_NOT_FOUND, body={'detail': 'Not found.'})
+        return entry
+
+    subrequest = build_subrequest(request, item['method'], url.path, url.query, item.get('body'))
+    subrequest.resolver_match = match
+    # Each sub-request gets the budget of the view it calls, within what is left of the batch's
+    url_name = match.url_name or UNNAMED
+    budget = budget_for(url_name)
+    try:
+        with deadline(budget) if budget is not None else nullcontext():
+            response = match.func(subrequest, *match.args, **match.kwargs)
+    except DeadlineExceeded:
+        # DeadlineMiddleware counts it once the batch's deadline is lifted
+        request.deadlines_exceeded.append(url_name)
+        logger.warning("Batch sub-request %s %s exceeded its %ss deadline", item['method'], url.path, budget)
+        entry.update(status=get_deadline_setting('STATUS_CODE'), body={'detail': EXCEEDED_DETAIL})
+        return entry
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", item['method'], url.path)
+        entry.update(status=status.HTTP_500_INTERNAL_SERVER_ERROR, body={'detail': 'Internal server error.'})
+        return entry
+    entry.update(status=response.status_code, body=response_body(response))
+    return entry
+
+
+def execute_in_worker(request, item):
+    try:
+        return execute(request, item)
+    finally:
+        connections.close_all()
+
+
+class BatchView(APIView):
+    """
+    Run several API requests in one round trip.
+
+    POST ``{"requests": [{"id", "method", "path", "body"}, ...], "parallel": false}``.
+    The batch is authenticated once and sub-requests run in-process, in
+    order. With ``parallel``, neighbouring GETs run concurrently on a thread
+    pool. Each sub-request gets its own status and its view's request
+    deadline, cut short by the batch's own. Sub-requests are not atomic: an
+    error in one does not undo the others.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['requests']
+        max_requests = get_batch_setting('MAX_REQUESTS')
+        if len(items) > max_requests:
+            return Response(
+                {'detail': f'A batch may contain at most {max_requests} requests.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if serializer.validated_data['parallel']:
+            results = self.run_parallel(request, items)
+        else:
+            results = [execute(request, item) for item in items]
+        return Response({'responses': results})
+
+    def run_parallel(self, request, items):
+        results = []
+        reads = []
+        with ThreadPoolExecutor(max_workers=get_batch_setting('MAX_WORKERS')) as pool:
+            def flush_reads():
+                # Each task runs in its own copy of this context, so it sees the batch's deadline
+                futures = [
+                    pool.submit(contextvars.copy_context().run, execute_in_worker, request, item) for item in reads
+                ]
+                results.extend(future.result() for future in futures)
+                reads.clear()
+
+            for item in items:
+                if item['method'] == 'GET':
+                    reads.append(item)
+                    continue
+                flush_reads()
+                results.append(execute(request, item))
+            flush_reads()
+        return results
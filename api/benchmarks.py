@@ -0,0 +1,41 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from .models import Business, Product, User
+
+
+@contextmanager
+def benchmark_database():
+    """
+    A throwaway test database for benchmark commands. It is file-backed so
+    worker threads share its data.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def populate_catalog(product_count):
+    """Create a business, an editor and ``product_count`` approved products. Returns the editor."""
+    business = Business.objects.create(name='Benchmark Business')
+    user = User.objects.create_user(username='bench', password='bench12345', business=business, role='editor')
+    Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}',
+            description=f'Description for product {i} with enough text to look realistic. ' * 3,
+            price=10 + i % 90,
+            status='approved',
+            created_by=user,
+            business=business,
+        )
+        for i in range(product_count)
+    ])
+    return user
@@ -0,0 +1,21 @@
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog-version'
+
+
+def get_catalog_version():
+    """Return the current catalog version, used to key cached product responses."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached product response by moving to a new version."""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        return cache.incr(CATALOG_VERSION_KEY)
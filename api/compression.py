@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from product_marketplace.conf import setting_getter
+from .cache import get_catalog_version
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+DEFAULTS = {
+    'MIN_LENGTH': 200,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    'CACHE_PATHS': [],
+    'CACHE_TIMEOUT': 300,
+}
+
+get_compression_setting = setting_getter('API_COMPRESSION', DEFAULTS)
+
+# Upper bound of the random padding added to compressed HTML, as in Django's GZipMiddleware
+HTML_PADDING_BYTES = 100
+
+
+def supported_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(accept_encoding, encodings=None):
+    """
+    Pick the best of ``encodings`` (default: every supported content-coding)
+    from an Accept-Encoding header, or return None if the client only
+    accepts identity.
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        token, _, params = item.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in encodings or supported_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_html(response):
+    return response.get('Content-Type', '').startswith('text/html')
+
+
+def compress(content, encoding, pad=False):
+    """
+    Compress ``content``. With ``pad``, random bytes in the gzip header vary
+    the compressed length, so it can't be used to guess secrets such as CSRF
+    tokens in the page (BREACH).
+    """
+    if pad:
+        return compress_string(content, max_random_bytes=HTML_PADDING_BYTES)
+    if encoding == 'br':
+        return brotli.compress(content, quality=get_compression_setting('BROTLI_QUALITY'))
+    return gzip.compress(content, compresslevel=get_compression_setting('GZIP_LEVEL'), mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best encoding the client accepts. HTML
+    pages, which may carry CSRF tokens, only get gzip with random padding.
+
+    Anonymous GET responses under ``API_COMPRESSION['CACHE_PATHS']`` are stored
+    in the cache already compressed, keyed on the URL, the Accept header, the
+    chosen encoding and the catalog version, so repeated hits skip the view,
+    the renderer and the compressor entirely.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        cache_key = self.get_cache_key(request, encoding)
+        if cache_key is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return self.response_from_cache(cached)
+
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        html = is_html(response)
+        if html:
+            encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), ['gzip'])
+        if encoding and self.should_compress(response):
+            content = compress(response.content, encoding, pad=html)
+            if len(content) < len(response.content):
+                response.content = content
+                response['Content-Encoding'] = encoding
+                response['Content-Length'] = str(len(content))
+
+        if cache_key is not None and self.should_cache(response):
+            cache.set(cache_key, {
+                'content': response.content,
+                'status': response.status_code,
+                'headers': {
+                    name: response[name]
+                    for name in ('Content-Type', 'Content-Encoding', 'Vary', 'Allow')
+                    if response.has_header(name)
+                },
+            }, get_compression_setting('CACHE_TIMEOUT'))
+        return response
+
+    def get_cache_key(self, request, encoding):
+        if request.method != 'GET' or 'HTTP_AUTHORIZATION' in request.META:
+            return None
+        if not any(request.path.startswith(prefix) for prefix in get_compression_setting('CACHE_PATHS')):
+            return None
+        if request.COOKIES.get(settings.SESSION_COOKIE_NAME):
+            return None
+        raw = '|'.join([
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            encoding or 'identity',
+            str(get_catalog_version()),
+        ])
+        return 'compressed-response:' + hashlib.sha256(raw.encode()).hexdigest()
+
+    def should_compress(self, response):
+        return (
+            not response.streaming
+            and not response.has_header('Content-Encoding')
+            and len(response.content) >= get_compression_setting('MIN_LENGTH')
+        )
+
+    def should_cache(self, response):
+        # Browsable API pages embed per-request data such as the CSRF token.
+        return response.status_code == 200 and not response.streaming and not is_html(response)
+
+    def response_from_cache(self, cached):
+        response = HttpResponse(cached['content'], status=cached['status'])
+        for name, value in cached['headers'].items():
+            response[name] = value
+        response['Content-Length'] = str(len(cached['content']))
+        return response
@@ -0,0 +1,228 @@
+import contextvars
+import logging
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from product_marketplace.conf import setting_getter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Wall-clock seconds a request may run before its database work is cancelled; None disables
+    'DEFAULT': 10.0,
+    # Budgets per URL name (router actions are named '<basename>-<action>'); None exempts a view
+    'VIEWS': {},
+    'STATUS_CODE': 503,
+    'RETRY_AFTER': 1,
+    # SQLite checks the deadline every this many virtual machine instructions
+    'SQLITE_PROGRESS_STEPS': 1000,
+    # PostgreSQL and MySQL queries may overrun the deadline by at most this many
+    # seconds; a smaller slack lowers the session timeout more often
+    'TIMEOUT_SLACK': 0.25,
+}
+
+get_deadline_setting = setting_getter('REQUEST_DEADLINES', DEFAULTS)
+
+# Metric name for requests whose URL pattern has no name
+UNNAMED = 'unnamed'
+EXCEEDED_DETAIL = 'The request took too long and was cancelled. Please retry or narrow the query.'
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _past_deadline():
+    expires = _deadline.get()
+    return expires is not None and time.monotonic() >= expires
+
+
+class DeadlineGuard:
+    """
+    Execute wrapper that stops one connection's queries at the current
+    deadline.
+
+    Queries are refused once the deadline has passed. Running queries are
+    cancelled by the database: SQLite through a progress handler,
+    PostgreSQL through ``statement_timeout`` and MySQL through
+    ``max_execution_time``. The session timeout is set to the time left
+    before a query, and set again once it would let a query run more than
+    ``TIMEOUT_SLACK`` seconds past the deadline. Nested deadlines share the
+    connection's guard.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.applied = False
+        self.previous = None
+        # Session timeout currently set, in milliseconds
+        self.timeout = None
+
+    def __call__(self, execute, sql, params, many, context):
+        expires = _deadline.get()
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline passed before the query started.')
+        self.apply(remaining)
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError as exc:
+            if time.monotonic() >= expires:
+                raise DeadlineExceeded('Query cancelled at the deadline.') from exc
+            raise
+
+    def apply(self, remaining):
+        vendor = self.connection.vendor
+        if vendor == 'sqlite':
+            if not self.applied:
+                self.connection.connection.set_progress_handler(_past_deadline, get_deadline_setting('SQLITE_PROGRESS_STEPS'))
+            self.applied = True
+            return
+        if vendor not in ('postgresql', 'mysql'):
+            return
+        timeout = max(int(remaining * 1000), 1)
+        # Raised again too when a nested, shorter deadline has ended
+        if self.timeout is not None and timeout <= self.timeout <= timeout + get_deadline_setting('TIMEOUT_SLACK') * 1000:
+            return
+        if not self.applied:
+            self.previous = self.run(
+                "SELECT current_setting('statement_timeout')" if vendor == 'postgresql'
+                else 'SELECT @@SESSION.max_execution_time'
+            )
+            self.applied = True
+        self.set_timeout(timeout)
+        self.timeout = timeout
+
+    def set_timeout(self, value):
+        if self.connection.vendor == 'postgresql':
+            self.run("SELECT set_config('statement_timeout', %s, false)", [str(value)])
+        else:
+            self.run('SET SESSION max_execution_time = %s', [value])
+
+    def run(self, statement, params=()):
+        # Use the driver cursor: Django's would run this through the wrapper again
+        with self.connection.connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            row = cursor.fetchone() if cursor.description else None
+        return row[0] if row else None
+
+    def reset(self):
+        if not self.applied or self.connection.connection is None:
+            return
+        try:
+            if self.connection.vendor == 'sqlite':
+                self.connection.connection.set_progress_handler(None, 0)
+            else:
+                # Put back the session's own timeout, e.g. one set in OPTIONS
+                self.set_timeout(self.previous)
+        except DatabaseError:
+            # Don't hand a connection with a leftover timeout to the next request
+            self.connection.close()
+
+
+@contextmanager
+def _guarded(connection):
+    guard = connection.deadline_guard = DeadlineGuard(connection)
+    try:
+        with connection.execute_wrapper(guard):
+            yield
+    finally:
+        guard.reset()
+        connection.deadline_guard = None
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Cancel database work on every connection after ``seconds``. Nested
+    deadlines can only shorten the outer one.
+    """
+    expires = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        expires = min(expires, outer)
+    token = _deadline.set(expires)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                connection = connections[alias]
+                # A nested deadline reuses the guard of the one around it
+                if getattr(connection, 'deadline_guard', None) is None:
+                    stack.enter_context(_guarded(connection))
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+def budget_for(url_name):
+    return get_deadline_setting('VIEWS').get(url_name, get_deadline_setting('DEFAULT'))
+
+
+def record_deadline_exceeded(url_name):
+    """
+    Count a cancelled request in the database, where every worker process
+    and the ``deadline_metrics`` command see it. Call it outside ``deadline()``;
+    within a request, append the URL name to ``request.deadlines_exceeded``.
+    """
+    from .models import DeadlineMetric
+    metrics = DeadlineMetric.objects.filter(url_name=url_name)
+    if metrics.update(exceeded=F('exceeded') + 1):
+        return
+    try:
+        with transaction.atomic():
+            DeadlineMetric.objects.create(url_name=url_name, exceeded=1)
+    except IntegrityError:
+        # Another process created the row first
+        metrics.update(exceeded=F('exceeded') + 1)
+
+
+def get_deadline_metrics():
+    """Deadline-exceeded counts per URL name, for every endpoint that has any."""
+    from .models import DeadlineMetric
+    return dict(DeadlineMetric.objects.filter(exceeded__gt=0).values_list('url_name', 'exceeded'))
+
+
+class DeadlineMiddleware:
+    """
+    Give each request a time budget, looked up by URL name in
+    ``REQUEST_DEADLINES``, and answer with a 503 and ``Retry-After``
+    when its database work runs past it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            url_name = resolve(request.path_info).url_name or UNNAMED
+        except Resolver404:
+            url_name = UNNAMED
+        budget = budget_for(url_name)
+        request.deadline_url_name = url_name
+        # URL names of this request, or its batch sub-requests, that ran out of time
+        request.deadlines_exceeded = []
+        with deadline(budget) if budget is not None else nullcontext():
+            response = self.get_response(request)
+        # Recorded once the deadline is lifted, or the counts themselves would be refused
+        for name in request.deadlines_exceeded:
+            record_deadline_exceeded(name)
+        return response
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, DeadlineExceeded):
+            return None
+        url_name = getattr(request, 'deadline_url_name', UNNAMED)
+        request.deadlines_exceeded.append(url_name)
+        logger.warning("Request to %s (%s) exceeded its %ss deadline: %s",
+                       request.path, url_name, budget_for(url_name), exception)
+        response = JsonResponse(
+            {'detail': EXCEEDED_DETAIL},
+            status=get_deadline_setting('STATUS_CODE'),
+        )
+        response['Retry-After'] = str(get_deadline_setting('RETRY_AFTER'))
+        return response
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import weakref
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from product_marketplace.conf import setting_getter
+from .models import ProductChange
+from .serializers import ProductChangeSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'POLL_INTERVAL': 1.0,
+    'HEARTBEAT_SECONDS': 15,
+    'QUEUE_SIZE': 256,
+    'REPLAY_LIMIT': 1000,
+    # Changes past a gap in the ids are held back this long for its transaction to commit
+    'GAP_GRACE_SECONDS': 30,
+    # Newest change ids checked for gaps
+    'GAP_SCAN_WINDOW': 1000,
+}
+
+get_events_setting = setting_getter('PRODUCT_EVENTS', DEFAULTS)
+
+
+def event_type(change):
+    """Name of the SSE event for a change: created, submitted, approved, updated or deleted."""
+    if change.action == 'updated' and change.status == 'pending_approval' and change.previous_status != 'pending_approval':
+        return 'submitted'
+    return change.action
+
+
+def can_subscribe(user):
+    return user.role in ['admin', 'approver'] or (user.role == 'editor' and user.business_id is not None)
+
+
+def visible_to(user, change):
+    """Approvers and admins see every change; editors only their own business's."""
+    if user.role in ['admin', 'approver']:
+        return True
+    return user.role == 'editor' and change.business_id == user.business_id
+
+
+def format_event(change):
+    data = json.dumps(ProductChangeSerializer(change).data, separators=(',', ':'))
+    return f'id: {change.id}\nevent: {event_type(change)}\ndata: {data}\n\n'
+
+
+def settled_change_id():
+    """
+    Highest change id a reader can move its cursor to without skipping
+    anything, or None when every change is settled.
+
+    Ids are taken when a row is inserted, but the row only becomes visible
+    when its transaction commits. On PostgreSQL or MySQL a lower id can
+    therefore appear after a higher one was read. A gap in the ids may be
+    such a transaction still in flight, so changes past it are held back
+    until the gap fills or is older than ``GAP_GRACE_SECONDS``. Older gaps
+    are taken for rolled-back transactions.
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_events_setting('GAP_GRACE_SECONDS'))
+    recent = list(
+        ProductChange.objects.order_by('-id').values_list('id', 'timestamp')[:get_events_setting('GAP_SCAN_WINDOW')]
+    )
+    recent.reverse()
+    for (previous_id, _), (change_id, timestamp) in zip(recent, recent[1:]):
+        if change_id != previous_id + 1 and timestamp > cutoff:
+            return previous_id
+    return None
+
+
+def settled(changes):
+    """Restrict a ProductChange queryset to settled changes."""
+    settled_id = settled_change_id()
+    return changes if settled_id is None else changes.filter(id__lte=settled_id)
+
+
+def latest_change_id():
+    return settled(ProductChange.objects.order_by('-id')).values_list('id', flat=True).first() or 0
+
+
+def changes_after(change_id, limit, up_to=None):
+    changes = settled(ProductChange.objects.filter(id__gt=change_id))
+    if up_to is not None:
+        changes = changes.filter(id__lte=up_to)
+    return list(changes.order_by('id')[:limit])
+
+
+class Subscription:
+    """One client's queue of pending changes."""
+
+    def __init__(self, user, last_id, size):
+        self.user = user
+        self.queue = asyncio.Queue(maxsize=size)
+        self.last_id = last_id
+        self.overflowed = False
+
+    def offer(self, change):
+        if change.id <= self.last_id or not visible_to(self.user, change):
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # A stalled client is disconnected; it resumes from Last-Event-ID
+            self.overflowed = True
+
+
+class ChangeBroker:
+    """
+    In-process fan-out of product changes to SSE subscribers.
+
+    A single task per event loop tails the ProductChange log and hands each
+    new row to every subscriber, so the database sees one query per poll
+    interval per process however many clients are connected. Reading the log
+    rather than in-process signals means changes made by other workers are
+    delivered too.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.cursor = None
+        self.task = None
+
+    def subscribe(self, user, last_id):
+        """Deliver changes after ``last_id`` to a new subscription."""
+        subscription = Subscription(user, last_id, get_events_setting('QUEUE_SIZE'))
+        self.subscribers.add(subscription)
+        # Never let the tail start past a subscriber's position
+        self.cursor = last_id if self.cursor is None else min(self.cursor, last_id)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.tail())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.cursor = None
+
+    def publish(self, changes):
+        for change in changes:
+            self.cursor = max(self.cursor or 0, change.id)
+            for subscription in list(self.subscribers):
+                subscription.offer(change)
+
+    async def poll(self):
+        self.publish(await sync_to_async(changes_after)(self.cursor, get_events_setting('REPLAY_LIMIT')))
+
+    async def tail(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Polling product changes failed")
+            await asyncio.sleep(get_events_setting('POLL_INTERVAL'))
+
+
+_brokers = weakref.WeakKeyDictionary()
+
+
+def get_broker():
+    """The broker for the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _brokers:
+        _brokers[loop] = ChangeBroker()
+    return _brokers[loop]
+
+
+async def stream_changes(user, last_event_id=None):
+    """
+    Yield SSE messages for changes visible to ``user``.
+
+    Clients reconnecting with ``Last-Event-ID`` first get what they missed
+    from the log, then live changes. A heartbeat comment keeps idle
+    connections open through proxies.
+    """
+    broker = get_broker()
+    start = await sync_to_async(latest_change_id)()
+    subscription = broker.subscribe(user, start)
+    try:
+        yield f"retry: {int(get_events_setting('POLL_INTERVAL') * 1000) + 1000}\n\n"
+        # Replay what the client missed up to the live starting point
+        cursor = start if last_event_id is None else last_event_id
+        limit = get_events_setting('REPLAY_LIMIT')
+        while cursor < start:
+            missed = await sync_to_async(changes_after)(cursor, limit, up_to=start)
+            if not missed:
+                break
+            for change in missed:
+                if visible_to(user, change):
+                    yield format_event(change)
+            cursor = missed[-1].id
+
+        while not subscription.overflowed:
+            try:
+                change = await asyncio.wait_for(subscription.queue.get(), get_events_setting('HEARTBEAT_SECONDS'))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if change.id <= subscription.last_id:
+                continue
+            subscription.last_id = change.id
+            yield format_event(change)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,94 @@
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Product
+
+MAX_ID = 2 ** 63 - 1
+
+
+class ProductFilterBackend(filters.BaseFilterBackend):
+    """
+    Range and multi-value filtering for products.
+
+    Supported query parameters:
+    - price_min / price_max: inclusive price bounds
+    - status__in: comma-separated list of statuses
+    - business__in: comma-separated list of business ids
+    - created_after / created_before: ISO date or datetime bounds
+
+    Every predicate is an equality, IN or range lookup on an indexed column,
+    so combined filters can be served by the composite indexes on Product.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        errors = {}
+        lookups = {}
+
+        for param, lookup in (('price_min', 'price__gte'), ('price_max', 'price__lte')):
+            if param in params:
+                try:
+                    value = Decimal(params[param])
+                except InvalidOperation:
+                    value = None
+                if value is None or not value.is_finite():
+                    errors[param] = ['A valid number is required.']
+                else:
+                    lookups[lookup] = value
+
+        if 'status__in' in params:
+            valid = {choice for choice, _ in Product.STATUS_CHOICES}
+            statuses = self._split(params['status__in'])
+            invalid = [value for value in statuses if value not in valid]
+            if invalid:
+                errors['status__in'] = [f'Invalid status: {", ".join(invalid)}.']
+            else:
+                lookups['status__in'] = statuses
+
+        if 'business__in' in params:
+            try:
+                ids = [int(value) for value in self._split(params['business__in'])]
+            except ValueError:
+                ids = None
+            # Ids outside a 64-bit primary key would overflow the database driver
+            if ids is None or not all(0 < value <= MAX_ID for value in ids):
+                errors['business__in'] = ['A comma-separated list of business ids is required.']
+            else:
+                lookups['business__in'] = ids
+
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lte')):
+            if param in params:
+                value = self._parse_datetime(params[param], end_of_day=(param == 'created_before'))
+                if value is None:
+                    errors[param] = ['A valid ISO date or datetime is required.']
+                else:
+                    lookups[lookup] = value
+
+        if 'price__gte' in lookups and 'price__lte' in lookups and lookups['price__gte'] > lookups['price__lte']:
+            errors['price_min'] = ['Must be less than or equal to price_max.']
+
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(**lookups) if lookups else queryset
+
+    @staticmethod
+    def _split(value):
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    @staticmethod
+    def _parse_datetime(value, end_of_day=False):
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                day = parse_date(value)
+                if day is None:
+                    return None
+                parsed = datetime.combine(day, time.max if end_of_day else time.min)
+        except ValueError:
+            return None
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
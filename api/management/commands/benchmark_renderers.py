@@ -0,0 +1,66 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from api.compression import compress, supported_encodings
+from api.models import Business, Product, User
+from api.renderers import MessagePackRenderer, msgpack
+from api.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark payload size and CPU cost of each renderer/compression combination on product pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=10, help='Products per page.')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed iterations per combination.')
+
+    def handle(self, *args, **options):
+        page = self.build_page(options['page_size'])
+        renderers = [('json', JSONRenderer())]
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+
+        iterations = options['iterations']
+        self.stdout.write(f'{"format":<10}{"encoding":<10}{"bytes":>10}{"render ms":>12}{"compress ms":>14}')
+        for name, renderer in renderers:
+            body = renderer.render(page)
+            render_ms = self.time_it(lambda: renderer.render(page), iterations)
+            self.stdout.write(f'{name:<10}{"identity":<10}{len(body):>10}{render_ms:>12.3f}{0:>14.3f}')
+            for encoding in supported_encodings():
+                compressed = compress(body, encoding)
+                compress_ms = self.time_it(lambda: compress(body, encoding), iterations)
+                self.stdout.write(f'{name:<10}{encoding:<10}{len(compressed):>10}{render_ms:>12.3f}{compress_ms:>14.3f}')
+
+    def build_page(self, page_size):
+        """Serialize an in-memory page shaped like a real /api/public/products/ response."""
+        business = Business(id=1, name='Acme Outdoor Supplies')
+        user = User(id=1, username='catalog_editor')
+        now = timezone.now()
+        products = [
+            Product(
+                id=i,
+                name=f'Trail Backpack {i} - 35L Waterproof',
+                description=(
+                    'Lightweight hiking backpack with padded shoulder straps, hydration sleeve, '
+                    'rain cover and multiple zip pockets. Ideal for day hikes and weekend trips. '
+                ) * 3,
+                price=Decimal('49.99') + i,
+                status='approved',
+                created_by=user,
+                business=business,
+                created_at=now,
+            )
+            for i in range(1, page_size + 1)
+        ]
+        request = APIRequestFactory().get('/api/public/products/')
+        results = ProductSerializer(products, many=True, context={'request': request}).data
+        return {'count': page_size * 50, 'next': 'http://testserver/api/public/products/?page=2', 'previous': None, 'results': results}
+
+    def time_it(self, func, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) * 1000 / iterations
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.deadlines import budget_for, get_deadline_metrics
+
+
+class Command(BaseCommand):
+    help = 'Show how many requests per endpoint were cancelled for exceeding their deadline.'
+
+    def handle(self, *args, **options):
+        metrics = get_deadline_metrics()
+        if not metrics:
+            self.stdout.write('No deadline-exceeded requests recorded.')
+            return
+        self.stdout.write(f'{"endpoint":<40}{"budget s":>10}{"exceeded":>10}')
+        for url_name, count in sorted(metrics.items(), key=lambda item: -item[1]):
+            budget = budget_for(url_name)
+            self.stdout.write(f'{url_name:<40}{"-" if budget is None else budget:>10}{count:>10}')
@@ -0,0 +1,87 @@
+import os
+import re
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+# importlib.import_module() (used by Django for settings, apps and URLconfs) is not
+# timed by -X importtime, so the boot script routes it through __import__ first.
+BOOT_SCRIPT = """
+import importlib, importlib.util, sys
+def import_module(name, package=None):
+    if name.startswith('.'):
+        name = importlib.util.resolve_name(name, package)
+    __import__(name)
+    return sys.modules[name]
+importlib.import_module = import_module
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Report per-module import time of a cold worker boot (django.setup() plus URLconf), '
+        'for the project apps and the slowest third-party modules.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest third-party modules to list.')
+        parser.add_argument('--all', action='store_true', help='List every project module, not just top-level ones.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'product_marketplace.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr)
+            return
+
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules.append((name, int(self_us), int(cumulative_us), len(indent)))
+
+        project_packages = self.project_packages()
+        is_project = lambda name: name.split('.')[0] in project_packages
+        # -X importtime prints children before their parent, one indent level deeper.
+        # Walk it backwards to know, for each module, the chain of imports that pulled it in.
+        project, third_party, chain = [], [], []
+        for module in reversed(modules):
+            while chain and chain[-1][3] >= module[3]:
+                chain.pop()
+            inside_project = any(is_project(parent[0]) for parent in chain)
+            if is_project(module[0]) and (options['all'] or not inside_project):
+                project.append(module)
+            elif not is_project(module[0]) and not chain:
+                third_party.append(module)
+            chain.append(module)
+
+        total_us = sum(m[2] for m in modules if m[3] == 1)
+        self.stdout.write(f'Cold boot import time: {total_us / 1000:.1f} ms\n')
+        self.write_table('Project modules', sorted(project, key=lambda m: -m[2]))
+        self.write_table('Slowest top-level third-party imports', sorted(third_party, key=lambda m: -m[2])[:options['top']])
+
+    def project_packages(self):
+        packages = {settings.ROOT_URLCONF.split('.')[0]}
+        for app in settings.INSTALLED_APPS:
+            module = app.split('.')[0]
+            if os.path.isdir(os.path.join(settings.BASE_DIR, module)):
+                packages.add(module)
+        return packages
+
+    def write_table(self, title, rows):
+        self.stdout.write(title)
+        self.stdout.write(f'  {"module":<50}{"self ms":>10}{"cumulative ms":>16}')
+        for name, self_us, cumulative_us, _ in rows:
+            self.stdout.write(f'  {name:<50}{self_us / 1000:>10.2f}{cumulative_us / 1000:>16.2f}')
+        self.stdout.write('')
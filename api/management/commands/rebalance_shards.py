@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from api.models import Business, Product, User
+from api.sharding import get_shards, mirror_to_shard, record_placement, shard_for_business
+
+
+class Command(BaseCommand):
+    help = (
+        'Move businesses between shards, either one business explicitly or an automatic plan '
+        'that evens out product counts. Pause writes for a business while it is being moved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help='Id of the business to move.')
+        parser.add_argument('--to', dest='target', help='Destination shard alias.')
+        parser.add_argument('--auto', action='store_true', help='Plan moves that balance product counts.')
+        parser.add_argument('--dry-run', action='store_true', help='Print the plan without moving anything.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products copied per transaction.')
+
+    def handle(self, *args, **options):
+        shards = get_shards()
+        if options['auto']:
+            moves = self.plan(shards)
+        elif options['business'] and options['target']:
+            if options['target'] not in shards:
+                raise CommandError(f"Unknown shard {options['target']!r}; configured shards: {', '.join(shards)}")
+            moves = [(options['business'], shard_for_business(options['business']), options['target'])]
+        else:
+            raise CommandError('Pass --auto, or --business and --to.')
+
+        moves = [move for move in moves if move[1] != move[2]]
+        if not moves:
+            self.stdout.write('Shards are already balanced.')
+        for business_id, source, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f'Would move business {business_id}: {source} -> {target}')
+                continue
+            moved = self.move_business(business_id, source, target, options['batch_size'])
+            self.stdout.write(f'Moved business {business_id} ({moved} products): {source} -> {target}')
+
+    def plan(self, shards):
+        """Greedy largest-first assignment of businesses to the least loaded shard."""
+        counts = {business_id: 0 for business_id in Business.objects.using('default').values_list('pk', flat=True)}
+        for shard in shards:
+            per_business = Product.objects.using(shard).values('business_id').annotate(total=Count('pk'))
+            for row in per_business:
+                counts[row['business_id']] = counts.get(row['business_id'], 0) + row['total']
+
+        load = {shard: 0 for shard in shards}
+        moves = []
+        for business_id, total in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            target = min(shards, key=lambda shard: (load[shard], shards.index(shard)))
+            load[target] += total
+            moves.append((business_id, shard_for_business(business_id), target))
+        return moves
+
+    def move_business(self, business_id, source, target, batch_size):
+        business = Business.objects.using('default').get(pk=business_id)
+
+        # The destination needs the business and every product creator before products can be copied
+        if target != 'default':
+            mirror_to_shard(business, target)
+            creator_ids = set(
+                Product.objects.using(source).filter(business_id=business_id).values_list('created_by_id', flat=True)
+            )
+            users = User.objects.using('default').filter(pk__in=creator_ids) | User.objects.using('default').filter(business_id=business_id)
+            for user in users.distinct():
+                mirror_to_shard(user, target)
+
+        moved = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Product.objects.using(source).filter(business_id=business_id, pk__gt=last_pk).order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic(using=target):
+                for product in batch:
+                    product._state.adding = True
+                    product._state.db = target
+                Product.objects.using(target).bulk_create(batch)
+            moved += len(batch)
+            last_pk = batch[-1].pk
+
+        # Flip placement before deleting the source copy so readers switch over
+        business.shard = target
+        Business.objects.using('default').filter(pk=business_id).update(shard=target)
+        record_placement(business_id, target)
+        if target != 'default':
+            mirror_to_shard(business, target)
+
+        # _raw_delete skips delete signals: the products are moving, not being deleted
+        source_products = Product.objects.using(source).filter(business_id=business_id)
+        source_products._raw_delete(source)
+        if source != 'default':
+            Business._base_manager.using(source).filter(pk=business_id).delete()
+        return moved
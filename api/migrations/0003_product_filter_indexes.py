@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_product_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'price'], name='product_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'created_at'], name='product_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['business', 'status', 'created_at'], name='product_biz_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at'], name='product_created_idx'),
+        ),
+    ]
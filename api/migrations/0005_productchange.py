@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_product_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('business_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('approved', 'Approved'), ('deleted', 'Deleted')], max_length=20)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('pending_approval', 'Pending Approval'), ('approved', 'Approved')], max_length=20)),
+                ('previous_status', models.CharField(blank=True, choices=[('draft', 'Draft'), ('pending_approval', 'Pending Approval'), ('approved', 'Approved')], max_length=20, null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['business_id', 'id'], name='productchange_business_idx')],
+            },
+        ),
+    ]
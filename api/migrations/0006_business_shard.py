@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_productchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='shard',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_products', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'claimed_at'], name='product_status_claimed_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_product_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVector',
+            fields=[
+                ('product_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('terms', models.JSONField(default=dict)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('product_id', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term'], name='productterm_term_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product_id', 'term'), name='productterm_product_term_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('related_id', models.BigIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product_id', '-score'], name='relatedproduct_lookup_idx'), models.Index(fields=['related_id'], name='relatedproduct_related_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product_id', 'related_id'), name='relatedproduct_pair_uniq')],
+            },
+        ),
+    ]
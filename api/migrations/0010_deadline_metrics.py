@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadlineMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=200, unique=True)),
+                ('exceeded', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
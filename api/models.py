@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from jobs.queue import enqueue
+from .cache import bump_catalog_version
 
 
 class User(AbstractUser):
@@ -33,11 +36,60 @@ class Business(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Database alias holding this business's products and users; blank means 'default'
+    shard = models.CharField(max_length=100, blank=True, default='')
 
     def __str__(self):
         return self.name
 
 
+# Approval-queue bookkeeping: updates setting only these are not edits
+QUEUE_FIELDS = frozenset({'claimed_by', 'claimed_at', 'updated_at'})
+
+
+class ProductQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """
+        Bulk updates that edit products move updated_at too, so cached
+        fragments keyed on it go stale, invalidate cached catalog responses,
+        refresh the related-products index and are written to the change log
+        like saves are. Claims and releases do none of this.
+        """
+        if not set(kwargs) - QUEUE_FIELDS:
+            return super().update(**kwargs)
+        kwargs.setdefault('updated_at', timezone.now())
+        with transaction.atomic(using=self.db):
+            before = {pk: (business_id, status) for pk, business_id, status in self.values_list('pk', 'business_id', 'status')}
+            updated = super().update(**kwargs)
+            after = dict(self.model._base_manager.using(self.db).filter(pk__in=before).values_list('pk', 'status'))
+        ProductChange.objects.bulk_create([
+            ProductChange(
+                product_id=pk,
+                business_id=business_id,
+                action=ProductChange.action_for(previous_status, after[pk]),
+                status=after[pk],
+                previous_status=previous_status,
+            )
+            for pk, (business_id, previous_status) in before.items() if pk in after
+        ])
+        # Approved products, and ones leaving that state, change other products' neighbours
+        version = f'{timezone.now().timestamp():.6f}'
+        for pk, (_, previous_status) in before.items():
+            if pk in after and 'approved' in (previous_status, after[pk]):
+                enqueue('api.refresh_related_products', {'product_id': pk}, idempotency_key=f'related:{pk}:{version}')
+        if updated:
+            bump_catalog_version()
+        return updated
+
+    def create(self, **kwargs):
+        # Leave the database unset unless chosen explicitly, so the router can
+        # place the new product on its business's shard.
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
 class Product(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -52,6 +104,120 @@ class Product(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     business = models.ForeignKey(Business, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Modification version: storefront fragments are cached per (id, updated_at)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Approval queue lease. No database constraint: approvers are not mirrored onto shards
+    claimed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_products', db_constraint=False
+    )
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'price'], name='product_status_price_idx'),
+            models.Index(fields=['status', 'created_at'], name='product_status_created_idx'),
+            models.Index(fields=['business', 'status', 'created_at'], name='product_biz_status_created_idx'),
+            models.Index(fields=['created_at'], name='product_created_idx'),
+            models.Index(fields=['status', 'claimed_at'], name='product_status_claimed_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class ProductChange(models.Model):
+    """
+    Append-only log of product changes, read by the change feed. The id is
+    the sync cursor, so consumers only ever read rows after their last token.
+    """
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('approved', 'Approved'),
+        ('deleted', 'Deleted'),
+    ]
+    # Plain ids rather than foreign keys so entries outlive deleted products
+    product_id = models.BigIntegerField()
+    business_id = models.BigIntegerField()
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    status = models.CharField(max_length=20, choices=Product.STATUS_CHOICES)
+    previous_status = models.CharField(max_length=20, choices=Product.STATUS_CHOICES, null=True, blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['business_id', 'id'], name='productchange_business_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} product {self.product_id}"
+
+    @staticmethod
+    def action_for(previous_status, status, created=False):
+        if created:
+            return 'created'
+        if status == 'approved' and previous_status not in (None, 'approved'):
+            return 'approved'
+        return 'updated'
+
+
+class ProductVector(models.Model):
+    """
+    Term counts and price of an approved product, the input to its
+    related-products entry. Kept so single products can be re-scored
+    without reloading the catalog.
+    """
+    product_id = models.BigIntegerField(primary_key=True)
+    terms = models.JSONField(default=dict)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"vector for product {self.product_id}"
+
+
+class ProductTerm(models.Model):
+    """Inverted index from a term to the approved products containing it."""
+    term = models.CharField(max_length=100)
+    product_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_id', 'term'], name='productterm_product_term_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['term'], name='productterm_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in product {self.product_id}"
+
+
+class RelatedProduct(models.Model):
+    """Precomputed nearest neighbours, read by the related-products endpoint."""
+    product_id = models.BigIntegerField()
+    related_id = models.BigIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_id', 'related_id'], name='relatedproduct_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['product_id', '-score'], name='relatedproduct_lookup_idx'),
+            models.Index(fields=['related_id'], name='relatedproduct_related_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class DeadlineMetric(models.Model):
+    """Requests cancelled for running past their deadline, per URL name."""
+    url_name = models.CharField(max_length=200, unique=True)
+    exceeded = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.url_name}: {self.exceeded}"
@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from jobs.pool import process_pool
+from product_marketplace.conf import setting_getter
+from .models import User
+from .serializers import ProvisionedUserSerializer
+from .sharding import is_sharded, shard_for_business
+
+DEFAULTS = {
+    'MAX_ROWS': 5000,
+    # Processes hashing passwords; None uses one per core, up to MAX_WORKERS
+    'WORKERS': None,
+    # Every web process keeps its hashing processes alive between requests
+    'MAX_WORKERS': 4,
+    # Shorter lists are hashed in the calling process; starting a pool costs more
+    'PARALLEL_THRESHOLD': 20,
+    'BATCH_SIZE': 500,
+}
+
+get_provisioning_setting = setting_getter('USER_PROVISIONING', DEFAULTS)
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def read_rows(file, format='csv'):
+    """
+    User rows from a CSV file with a header line, or a JSON list of objects
+    (optionally wrapped as ``{"users": [...]}``).
+    """
+    content = file.read()
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ProvisioningError('The file must be UTF-8 encoded.')
+    if format == 'json':
+        try:
+            rows = json.loads(content)
+        except ValueError as exc:
+            raise ProvisioningError(f'Invalid JSON: {exc}')
+        if isinstance(rows, dict):
+            rows = rows.get('users')
+        if not isinstance(rows, list):
+            raise ProvisioningError('Expected a list of users.')
+        return rows
+    # Blank cells fall back to the field's default instead of failing validation
+    return [
+        {key.strip(): value for key, value in row.items() if key and value not in (None, '')}
+        for row in csv.DictReader(io.StringIO(content))
+    ]
+
+
+# Hashing pools by size, shared by every request in this process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def hashing_pool(workers):
+    """The process's pool of ``workers`` hashing processes, started on first use."""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = process_pool(workers)
+        return _pools[workers]
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Hash ``passwords`` with the configured hasher, in order, spreading the
+    work over a process pool. Blank passwords become unusable ones, which
+    cost nothing to make.
+    """
+    # An explicit count (provision_users --workers) is used as given
+    workers = workers or get_provisioning_setting('WORKERS') or min(os.cpu_count() or 1, get_provisioning_setting('MAX_WORKERS'))
+    to_hash = [password for password in passwords if password]
+    if workers > 1 and len(to_hash) >= get_provisioning_setting('PARALLEL_THRESHOLD'):
+        pool = hashing_pool(workers)
+        try:
+            hashed = list(pool.map(make_password, to_hash, chunksize=max(1, len(to_hash) // (workers * 4))))
+        except BrokenProcessPool:
+            # A worker died; the next request starts a fresh pool
+            with _pools_lock:
+                if _pools.get(workers) is pool:
+                    del _pools[workers]
+            raise
+    else:
+        hashed = [make_password(password) for password in to_hash]
+    hashed = iter(hashed)
+    return [next(hashed) if password else make_password(None) for password in passwords]
+
+
+def validate_rows(rows, default_role=None):
+    """
+    Validate every row. Returns ``(valid, errors)``: ``(row number, data)``
+    pairs and ``{"row", "errors"}`` entries, with rows numbered from 1.
+    """
+    valid, errors, seen = [], [], {}
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'non_field_errors': ['Expected an object of user fields.']}})
+            continue
+        if default_role and not row.get('role'):
+            row = {**row, 'role': default_role}
+        serializer = ProvisionedUserSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'row': number, 'errors': serializer.errors})
+            continue
+        username = serializer.validated_data['username']
+        if username in seen:
+            errors.append({'row': number, 'errors': {'username': [f'Duplicate of row {seen[username]}.']}})
+            continue
+        seen[username] = number
+        valid.append((number, serializer.validated_data))
+    return _drop_taken(valid, errors)
+
+
+def _drop_taken(valid, errors):
+    taken = set(User.objects.filter(username__in=[data['username'] for _, data in valid]).values_list('username', flat=True))
+    errors.extend(
+        {'row': number, 'errors': {'username': ['A user with that username already exists.']}}
+        for number, data in valid if data['username'] in taken
+    )
+    errors.sort(key=lambda error: error['row'])
+    return [(number, data) for number, data in valid if data['username'] not in taken], errors
+
+
+def provision_users(rows, business, default_role=None, dry_run=False, workers=None):
+    """
+    Create the valid ``rows`` as users of ``business``, as ``perform_create``
+    on the users endpoint would: the business is fixed and the role comes
+    from the row. Invalid rows are skipped and reported.
+
+    Returns ``(users, errors)``. With ``dry_run`` the users are validated
+    but neither hashed nor saved.
+    """
+    if len(rows) > get_provisioning_setting('MAX_ROWS'):
+        raise ProvisioningError(f"At most {get_provisioning_setting('MAX_ROWS')} users can be provisioned at once.")
+    valid, errors = validate_rows(rows, default_role)
+    if dry_run:
+        return [User(business=business, **_without_password(data)) for _, data in valid], errors
+
+    passwords = hash_passwords([data.get('password', '') for _, data in valid], workers)
+    pending = [
+        (number, User(business=business, password=password, **_without_password(data)))
+        for (number, data), password in zip(valid, passwords)
+    ]
+    while pending:
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    [user for _, user in pending], batch_size=get_provisioning_setting('BATCH_SIZE')
+                )
+            break
+        except IntegrityError:
+            # Someone took a username since validation; report those rows and insert the rest
+            still_free, errors = _drop_taken([(number, {'username': user.username}) for number, user in pending], errors)
+            if len(still_free) == len(pending):
+                raise
+            free_rows = {number for number, _ in still_free}
+            pending = [(number, user) for number, user in pending if number in free_rows]
+    else:
+        users = []
+    _mirror_users(users, business)
+    return users, errors
+
+
+def _without_password(data):
+    return {key: value for key, value in data.items() if key != 'password'}
+
+
+def _mirror_users(users, business):
+    # bulk_create sends no post_save, so copy the users onto the business's shard here
+    if not users or not is_sharded():
+        return
+    shard = shard_for_business(business.pk)
+    if shard == 'default':
+        return
+    if any(user.pk is None for user in users):
+        users = list(User.objects.filter(username__in=[user.username for user in users]))
+    fields = User._meta.concrete_fields
+    User._base_manager.using(shard).bulk_create(
+        [User(**{field.attname: getattr(user, field.attname) for field in fields}) for user in users],
+        batch_size=get_provisioning_setting('BATCH_SIZE'),
+    )
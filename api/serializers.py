@@ -1,5 +1,21 @@
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import User, Business, Product
+from .models import User, Business, Product, ProductChange
+
+
+class SparseFieldsMixin:
+    """
+    Drop any fields not listed in the ``fields`` entry of the serializer context.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        allowed = self.context.get('fields')
+        if allowed is not None:
+            for name in set(self.fields) - set(allowed):
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -9,14 +25,37 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class ProvisionedUserSerializer(serializers.ModelSerializer):
+    """
+    One row of a bulk provisioning list. Username uniqueness is checked for
+    the whole list at once by api.provisioning, not a query per row.
+    """
+    password = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False, write_only=True)
+
+    class Meta:
+        model = User
+        fields = ['username', 'email', 'role', 'first_name', 'last_name', 'password']
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
+
+    def validate(self, attrs):
+        password = attrs.get('password')
+        if password:
+            try:
+                validate_password(password, user=User(**{key: value for key, value in attrs.items() if key != 'password'}))
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({'password': list(exc.messages)})
+        return attrs
+
+
 class BusinessSerializer(serializers.ModelSerializer):
     class Meta:
         model = Business
-        fields = '__all__'
+        # Placement only changes through rebalance_shards, which also moves the products
+        exclude = ['shard']
         read_only_fields = ['id', 'created_at']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     business_name = serializers.CharField(source='business.name', read_only=True)
     image = serializers.ImageField(required=False)
@@ -29,3 +68,25 @@ class ProductSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
+
+
+class ProductChangeSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(source='product_id')
+    business = serializers.IntegerField(source='business_id')
+
+    class Meta:
+        model = ProductChange
+        fields = ['id', 'product', 'business', 'action', 'status', 'timestamp']
+
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    id = serializers.CharField(required=False, max_length=100)
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(many=True, allow_empty=False)
+    # Run neighbouring GETs concurrently; writes always run alone, in order
+    parallel = serializers.BooleanField(default=False)
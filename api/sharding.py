@@ -0,0 +1,290 @@
+import heapq
+from itertools import islice
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models
+
+# Each shard allocates product ids from its own range, so ids stay globally unique
+SHARD_ID_SPAN = 2 ** 40
+PLACEMENT_CACHE_TIMEOUT = 60
+
+SHARDED_MODELS = {'api.product'}
+
+
+def get_shards():
+    return list(getattr(settings, 'SHARDS', ['default']))
+
+
+def is_sharded():
+    return len(get_shards()) > 1
+
+
+def initial_shard(business_id):
+    """Shard a new business is placed on: chosen by business id."""
+    shards = get_shards()
+    return shards[business_id % len(shards)]
+
+
+def shard_for_business(business_id):
+    """
+    Return the database alias holding a business's products and users.
+
+    Placement is recorded on Business.shard in the default database; businesses
+    without one predate sharding and live on the default database. It is
+    memoised in the shared cache, which every process reads, so a move made
+    by rebalance_shards reaches all of them at once.
+    """
+    if business_id is None or not is_sharded():
+        return 'default'
+    key = placement_key(business_id)
+    shard = cache.get(key)
+    if shard is None:
+        from .models import Business
+        shard = Business.objects.using('default').filter(pk=business_id).values_list('shard', flat=True).first()
+        shard = shard or 'default'
+        # add(), not set(): a placement recorded by a move since our read wins
+        cache.add(key, shard, PLACEMENT_CACHE_TIMEOUT)
+        shard = cache.get(key, shard)
+    return shard
+
+
+def placement_key(business_id):
+    return f'business-shard:{business_id}'
+
+
+def record_placement(business_id, shard):
+    """Point every process at a business's new shard."""
+    cache.set(placement_key(business_id), shard, PLACEMENT_CACHE_TIMEOUT)
+
+
+class BusinessShardRouter:
+    """
+    Route products to their business's shard. Users and businesses are
+    written to the default database and mirrored onto their shard (see
+    api.signals), so shard-local joins and foreign keys keep working.
+    With a single shard every method defers to Django's defaults.
+    """
+
+    def db_for_write(self, model, **hints):
+        if not is_sharded() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        return shard_for_business(instance.business_id)
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if is_sharded() and instance is not None and model._meta.label_lower in SHARDED_MODELS:
+            return instance._state.db or shard_for_business(instance.business_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users and businesses exist on every shard their products are on
+        if is_sharded() and obj1._meta.app_label == obj2._meta.app_label == 'api':
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every shard carries the full schema
+        return None
+
+
+def mirror_to_shard(instance, shard):
+    """Copy a row to a shard under the same primary key."""
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields if not field.primary_key
+    }
+    model._base_manager.using(shard).update_or_create(pk=instance.pk, defaults=values)
+
+
+def sharded(queryset):
+    """
+    Spread a queryset over every shard. With a single shard the queryset is
+    returned unchanged.
+    """
+    if not is_sharded():
+        return queryset
+    return ShardedQuerySet([queryset.using(alias) for alias in get_shards()])
+
+
+class _SortValue:
+    """One ordering column of a row, comparable in either direction, NULLs first."""
+    __slots__ = ('value', 'descending')
+
+    def __init__(self, value, descending):
+        self.value = value
+        self.descending = descending
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        a, b = (other.value, self.value) if self.descending else (self.value, other.value)
+        if a is None or b is None:
+            return a is None and b is not None
+        return a < b
+
+
+class ShardedQuerySet:
+    """
+    Read-only fan-out over one queryset per shard.
+
+    Implements the parts of the QuerySet API used by DRF filtering and
+    pagination. Results are merged in the queryset's ordering, so a page
+    ``[offset:offset + limit]`` reads at most ``offset + limit`` rows per shard.
+    """
+    CHAINABLE = (
+        'all', 'filter', 'exclude', 'order_by', 'select_related', 'prefetch_related',
+        'only', 'defer', 'distinct', 'annotate', 'none',
+    )
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self.model = self.querysets[0].model
+
+    def __getattr__(self, name):
+        if name in self.CHAINABLE:
+            def chained(*args, **kwargs):
+                return ShardedQuerySet(getattr(qs, name)(*args, **kwargs) for qs in self.querysets)
+            return chained
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f'<ShardedQuerySet over {len(self.querysets)} shards>'
+
+    @property
+    def ordered(self):
+        return all(qs.ordered for qs in self.querysets)
+
+    @property
+    def db(self):
+        return None
+
+    def using(self, alias):
+        for qs in self.querysets:
+            if qs.db == alias:
+                return qs
+        raise ValueError(f'Unknown shard: {alias}')
+
+    def count(self):
+        return sum(qs.count() for qs in self.querysets)
+
+    def exists(self):
+        return any(qs.exists() for qs in self.querysets)
+
+    def get(self, *args, **kwargs):
+        matches = []
+        for qs in self.querysets:
+            matches.extend(qs.filter(*args, **kwargs)[:2])
+        if not matches:
+            raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+        if len(matches) > 1:
+            raise self.model.MultipleObjectsReturned(f'get() returned more than one {self.model._meta.object_name}.')
+        return matches[0]
+
+    def first(self):
+        page = self[0:1]
+        return page[0] if page else None
+
+    def ordering(self):
+        query = self.querysets[0].query
+        if query.order_by:
+            fields = list(query.order_by)
+        elif query.default_ordering and self.model._meta.ordering:
+            fields = list(self.model._meta.ordering)
+        else:
+            fields = []
+        if not all(isinstance(field, str) for field in fields):
+            raise TypeError('ShardedQuerySet only supports ordering by field names.')
+        fields = [field for field in fields if field != '?']
+        # Tie-break on the primary key so merged pages are stable
+        if not any(field.lstrip('-') in ('pk', self.model._meta.pk.name) for field in fields):
+            fields.append('pk')
+        return fields
+
+    def _clone(self):
+        return ShardedQuerySet(qs._clone() for qs in self.querysets)
+
+    def _merge(self, stop=None):
+        fields = self.ordering()
+
+        def sort_key(obj):
+            key = []
+            for field in fields:
+                value = obj
+                for attr in field.lstrip('-').split('__'):
+                    value = getattr(value, attr) if value is not None else None
+                if isinstance(value, models.Model):
+                    value = value.pk
+                key.append(_SortValue(value, field.startswith('-')))
+            return key
+
+        shard_results = []
+        for qs in self.querysets:
+            qs = load_fields(qs.order_by(*fields), [field.lstrip('-').split('__')[0] for field in fields])
+            shard_results.append(qs[:stop] if stop is not None else qs.iterator())
+        return heapq.merge(*shard_results, key=sort_key)
+
+    def __iter__(self):
+        return iter(self._merge())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError('ShardedQuerySet does not support slice steps.')
+            start = key.start or 0
+            return list(islice(self._merge(stop=key.stop), start, key.stop))
+        if key < 0:
+            raise ValueError('Negative indexing is not supported.')
+        page = self[key:key + 1]
+        if not page:
+            raise IndexError('ShardedQuerySet index out of range')
+        return page[0]
+
+
+def load_fields(queryset, names):
+    """
+    Make sure ``only()`` or ``defer()`` on ``queryset`` still load the
+    ``names`` fields, which the merge reads from every row.
+    """
+    names = {queryset.model._meta.pk.name if name == 'pk' else name for name in names}
+    loaded, deferred = queryset.query.deferred_loading
+    if deferred and loaded & names:
+        return queryset.defer(None).defer(*(loaded - names))
+    if not deferred and loaded and not names <= loaded:
+        return queryset.only(*loaded, *names)
+    return queryset
+
+
+def seed_shard_sequences(using):
+    """
+    Start a shard's product ids at ``shard index * SHARD_ID_SPAN`` so ids
+    never collide across shards. Safe to run repeatedly.
+    """
+    shards = get_shards()
+    if using not in shards or shards.index(using) == 0:
+        return
+    from .models import Product
+    start = shards.index(using) * SHARD_ID_SPAN
+    table = Product._meta.db_table
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s', [start, table])
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                [table, start, table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                [table, start],
+            )
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {int(start) + 1}')
@@ -0,0 +1,98 @@
+from django.db.models.signals import post_init, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from jobs.queue import enqueue
+from .cache import bump_catalog_version
+from .models import Business, Product, ProductChange, User
+from .sharding import initial_shard, is_sharded, mirror_to_shard, seed_shard_sequences, shard_for_business
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Business)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    # Cached product responses embed the business name
+    bump_catalog_version()
+
+
+@receiver(post_init, sender=Product)
+def remember_loaded_status(sender, instance, **kwargs):
+    # Read __dict__ directly so a deferred status field is not loaded
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+def queue_related_products_refresh(product, previous_status, version):
+    # Approved products, and ones leaving that state, change other products' neighbours
+    if product.status == 'approved' or previous_status == 'approved':
+        enqueue(
+            'api.refresh_related_products',
+            {'product_id': product.pk},
+            idempotency_key=f'related:{product.pk}:{version}',
+        )
+
+
+@receiver(post_save, sender=Product)
+def log_product_save(sender, instance, created, **kwargs):
+    # Everything reading the previous status runs here, before it is reset,
+    # rather than in receivers that would depend on connection order
+    previous_status = None if created else instance._loaded_status
+    queue_related_products_refresh(instance, previous_status, f'{instance.updated_at.timestamp():.6f}')
+    ProductChange.objects.create(
+        product_id=instance.pk,
+        business_id=instance.business_id,
+        action=ProductChange.action_for(previous_status, instance.status, created),
+        status=instance.status,
+        previous_status=previous_status,
+    )
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Product)
+def log_product_delete(sender, instance, **kwargs):
+    queue_related_products_refresh(instance, instance._loaded_status, 'deleted')
+    ProductChange.objects.create(
+        product_id=instance.pk,
+        business_id=instance.business_id,
+        action='deleted',
+        status=instance.status,
+        previous_status=instance.status,
+    )
+
+
+@receiver(post_save, sender=Business)
+def place_business(sender, instance, created, using, **kwargs):
+    # Mirrored copies are saved on shards; only the default row drives placement
+    if using != 'default' or not is_sharded():
+        return
+    if created and not instance.shard:
+        instance.shard = initial_shard(instance.pk)
+        Business.objects.using('default').filter(pk=instance.pk).update(shard=instance.shard)
+    if instance.shard and instance.shard != 'default':
+        mirror_to_shard(instance, instance.shard)
+
+
+@receiver(post_save, sender=User)
+def mirror_user(sender, instance, using, **kwargs):
+    if using != 'default' or not is_sharded():
+        return
+    shard = shard_for_business(instance.business_id)
+    if shard != 'default':
+        mirror_to_shard(instance, shard)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Business)
+def delete_shard_copy(sender, instance, using, **kwargs):
+    if using != 'default' or not is_sharded():
+        return
+    if sender is Business:
+        shard = instance.shard or 'default'
+    else:
+        shard = shard_for_business(instance.business_id)
+    if shard != 'default':
+        sender._base_manager.using(shard).filter(pk=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def seed_product_ids(sender, using, **kwargs):
+    if sender.name == 'api':
+        seed_shard_sequences(using)
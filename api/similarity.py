@@ -0,0 +1,233 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from product_marketplace.conf import setting_getter
+from .models import Product, ProductTerm, ProductVector, RelatedProduct
+from .sharding import sharded
+
+DEFAULTS = {
+    'TOP_K': 10,
+    # Share of the score from text similarity; the rest comes from price proximity
+    'TEXT_WEIGHT': 0.8,
+    # Name terms count this many times more than description terms
+    'NAME_WEIGHT': 2,
+    # Terms in more than this share of products are too common to relate anything
+    'MAX_DOCUMENT_FREQUENCY': 0.5,
+    # Products sharing the most terms that an incremental refresh scores
+    'MAX_CANDIDATES': 500,
+}
+
+get_similarity_setting = setting_getter('RELATED_PRODUCTS', DEFAULTS)
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOP_WORDS = frozenset(
+    'an and are as at be but by for from has have in is it its of on or our so that the this to was with you your'.split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+def term_counts(name, description):
+    counts = Counter(tokenize(description))
+    name_weight = get_similarity_setting('NAME_WEIGHT')
+    for token in tokenize(name):
+        counts[token] += name_weight
+    return dict(counts)
+
+
+def max_document_frequency(total):
+    # Small catalogs keep every shared term; otherwise the cut-off would drop them all
+    return max(2, get_similarity_setting('MAX_DOCUMENT_FREQUENCY') * total)
+
+
+def tfidf(counts, document_frequency, total):
+    """L2-normalised TF-IDF weights for one product's term counts."""
+    cutoff = max_document_frequency(total)
+    weights = {
+        term: (1 + math.log(count)) * (math.log((1 + total) / (1 + document_frequency.get(term, 0))) + 1)
+        for term, count in counts.items()
+        if document_frequency.get(term, 0) <= cutoff
+    }
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+
+def price_similarity(a, b):
+    a, b = float(a), float(b)
+    if a <= 0 or b <= 0:
+        return 1.0 if a == b else 0.0
+    return 1 / (1 + abs(math.log(a / b)))
+
+
+def combine(cosine, price_a, price_b):
+    """Blend text and price similarity. Products sharing no terms are unrelated."""
+    if cosine <= 0:
+        return 0.0
+    text_weight = get_similarity_setting('TEXT_WEIGHT')
+    return text_weight * cosine + (1 - text_weight) * price_similarity(price_a, price_b)
+
+
+def cosine(vector_a, vector_b):
+    if len(vector_a) > len(vector_b):
+        vector_a, vector_b = vector_b, vector_a
+    return sum(weight * vector_b.get(term, 0.0) for term, weight in vector_a.items())
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Recompute every approved product's neighbours from scratch and replace
+    the stored index. Returns the number of products indexed.
+    """
+    top_k = get_similarity_setting('TOP_K')
+    products = sharded(Product.objects.filter(status='approved').only('id', 'name', 'description', 'price'))
+    counts, prices = {}, {}
+    for product in products:
+        counts[product.pk] = term_counts(product.name, product.description)
+        prices[product.pk] = product.price
+    total = len(counts)
+    document_frequency = Counter(term for terms in counts.values() for term in terms)
+    vectors = {product_id: tfidf(terms, document_frequency, total) for product_id, terms in counts.items()}
+
+    postings = defaultdict(list)
+    for product_id, vector in vectors.items():
+        for term, weight in vector.items():
+            postings[term].append((product_id, weight))
+
+    related = []
+    for product_id, vector in vectors.items():
+        # Sparse dot products: only products sharing a term are ever touched
+        dots = defaultdict(float)
+        for term, weight in vector.items():
+            for other_id, other_weight in postings[term]:
+                if other_id != product_id:
+                    dots[other_id] += weight * other_weight
+        scored = ((combine(dot, prices[product_id], prices[other_id]), other_id) for other_id, dot in dots.items())
+        related.extend(
+            RelatedProduct(product_id=product_id, related_id=other_id, score=score)
+            for score, other_id in heapq.nlargest(top_k, scored) if score > 0
+        )
+
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        ProductTerm.objects.all().delete()
+        ProductVector.objects.all().delete()
+        ProductVector.objects.bulk_create(
+            [ProductVector(product_id=product_id, terms=terms, price=prices[product_id]) for product_id, terms in counts.items()],
+            batch_size=batch_size,
+        )
+        ProductTerm.objects.bulk_create(
+            [ProductTerm(product_id=product_id, term=term) for product_id, terms in counts.items() for term in terms],
+            batch_size=batch_size,
+        )
+        RelatedProduct.objects.bulk_create(related, batch_size=batch_size)
+    return total
+
+
+def refresh_product(product_id):
+    """
+    Re-score one product after it was approved, edited or deleted.
+
+    Its own neighbour list is recomputed against the ``MAX_CANDIDATES``
+    products sharing most of its terms, and it is inserted into their lists
+    where it now ranks in the top k. Lists it dropped out of are topped up
+    so they stay k long. Document frequencies drift between rebuilds, so
+    scores stored for other products are approximate until the next full
+    rebuild.
+    """
+    top_k = get_similarity_setting('TOP_K')
+    product = sharded(
+        Product.objects.filter(pk=product_id, status='approved').only('id', 'name', 'description', 'price')
+    ).first()
+
+    with transaction.atomic():
+        holders = set(RelatedProduct.objects.filter(related_id=product_id).values_list('product_id', flat=True))
+        ProductVector.objects.filter(product_id=product_id).delete()
+        ProductTerm.objects.filter(product_id=product_id).delete()
+        RelatedProduct.objects.filter(Q(product_id=product_id) | Q(related_id=product_id)).delete()
+        if product is None:
+            _refill_lists(holders, top_k)
+            return []
+
+        counts = term_counts(product.name, product.description)
+        ProductVector.objects.create(product_id=product_id, terms=counts, price=product.price)
+        ProductTerm.objects.bulk_create([ProductTerm(product_id=product_id, term=term) for term in counts])
+
+        scored = _score_candidates(product_id, counts, product.price)
+        top = heapq.nlargest(top_k, scored)
+        RelatedProduct.objects.bulk_create(
+            [RelatedProduct(product_id=product_id, related_id=other_id, score=score) for score, other_id in top]
+        )
+        inserted = _insert_into_neighbours(product_id, scored, top_k)
+        _refill_lists(holders - inserted, top_k)
+    return [other_id for _, other_id in top]
+
+
+def _score_candidates(product_id, counts, price):
+    """``(score, product id)`` pairs for the products sharing most terms with ``counts``."""
+    total = ProductVector.objects.count()
+    document_frequency = _document_frequency(counts)
+    cutoff = max_document_frequency(total)
+    shared_terms = [term for term in counts if document_frequency.get(term, 0) <= cutoff]
+    candidate_ids = (
+        ProductTerm.objects.filter(term__in=shared_terms).exclude(product_id=product_id)
+        .values('product_id').annotate(shared=Count('id')).order_by('-shared', 'product_id')
+        .values_list('product_id', flat=True)[:get_similarity_setting('MAX_CANDIDATES')]
+    )
+    candidates = list(ProductVector.objects.filter(product_id__in=list(candidate_ids)))
+    document_frequency.update(_document_frequency({term for candidate in candidates for term in candidate.terms}))
+
+    vector = tfidf(counts, document_frequency, total)
+    scored = []
+    for candidate in candidates:
+        score = combine(cosine(vector, tfidf(candidate.terms, document_frequency, total)), price, candidate.price)
+        if score > 0:
+            scored.append((score, candidate.product_id))
+    return scored
+
+
+def _refill_lists(product_ids, top_k):
+    # Top up lists that lost a neighbour, keeping the scores already stored
+    for vector in ProductVector.objects.filter(product_id__in=list(product_ids)):
+        listed = set(RelatedProduct.objects.filter(product_id=vector.product_id).values_list('related_id', flat=True))
+        if len(listed) >= top_k:
+            continue
+        scored = [
+            (score, other_id) for score, other_id in _score_candidates(vector.product_id, vector.terms, vector.price)
+            if other_id not in listed
+        ]
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=vector.product_id, related_id=other_id, score=score)
+            for score, other_id in heapq.nlargest(top_k - len(listed), scored)
+        ])
+
+
+def _document_frequency(terms):
+    return dict(
+        ProductTerm.objects.filter(term__in=list(terms)).values_list('term').annotate(products=Count('id'))
+    )
+
+
+def _insert_into_neighbours(product_id, scored, top_k):
+    """Add ``product_id`` to the lists it ranks in; returns the ids of those lists."""
+    lists = {
+        row['product_id']: row
+        for row in RelatedProduct.objects.filter(product_id__in=[other_id for _, other_id in scored])
+        .values('product_id').annotate(size=Count('id'), lowest=Min('score'))
+    }
+    new_rows = []
+    for score, other_id in scored:
+        current = lists.get(other_id, {'size': 0, 'lowest': 0.0})
+        if current['size'] < top_k:
+            new_rows.append(RelatedProduct(product_id=other_id, related_id=product_id, score=score))
+        elif score > current['lowest']:
+            # Replacing the lowest neighbour keeps the list k long
+            lowest = RelatedProduct.objects.filter(product_id=other_id).order_by('score', 'id').values_list('pk', flat=True).first()
+            RelatedProduct.objects.filter(pk=lowest).delete()
+            new_rows.append(RelatedProduct(product_id=other_id, related_id=product_id, score=score))
+    RelatedProduct.objects.bulk_create(new_rows)
+    return {row.product_id for row in new_rows}
@@ -0,0 +1,34 @@
+from django.conf import settings
+from jobs.queue import task
+from .cache import bump_catalog_version
+from .models import Product
+from .sharding import sharded
+from .similarity import refresh_product
+
+
+@task('api.optimize_product_image')
+def optimize_product_image(product_id, image_name):
+    """Downscale an uploaded product image to PRODUCT_IMAGE_MAX_SIZE in place."""
+    from PIL import Image  # only worker processes need Pillow loaded
+    product = sharded(Product.objects.filter(pk=product_id).only('image', 'business')).first()
+    # Skip if the product is gone or its image was replaced since the job was queued
+    if product is None or not product.image or product.image.name != image_name:
+        return
+    max_size = getattr(settings, 'PRODUCT_IMAGE_MAX_SIZE', 1600)
+    with product.image.open('rb') as image_file:
+        image = Image.open(image_file)
+        image.load()
+    if max(image.size) <= max_size:
+        return
+    image_format = image.format
+    image.thumbnail((max_size, max_size))
+    with product.image.storage.open(product.image.name, 'wb') as image_file:
+        image.save(image_file, format=image_format)
+
+
+@task('api.refresh_related_products')
+def refresh_related_products(product_id):
+    """Re-score one product in the related-products index."""
+    refresh_product(product_id)
+    # Public responses are cached per catalog version; serve the new neighbours
+    bump_catalog_version()
@@ -1,3 +1,5 @@
+import os
+from io import StringIO
 import pytest
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
@@ -12,6 +14,14 @@ def api_client():
     return APIClient()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    from django.core.cache import cache
+    # Tests run in one process, so a local cache stands in for the shared one
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    cache.clear()
+
+
 @pytest.fixture
 def business(db):
     return Business.objects.create(name="Test Business", description="A test business")
@@ -43,6 +53,17 @@ def test_business_creation(business):
     assert str(business) == "Test Business"
 
 
+@pytest.mark.django_db
+def test_business_shard_is_not_exposed(api_client, editor_user, business):
+    Business.objects.filter(pk=business.pk).update(shard='default')
+    api_client.force_authenticate(user=editor_user)
+    response = api_client.patch(f'/api/businesses/{business.pk}/', {'name': "Renamed", 'shard': 'bogus'}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    assert 'shard' not in response.data
+    business.refresh_from_db()
+    assert (business.name, business.shard) == ("Renamed", 'default')
+
+
 @pytest.mark.django_db
 def test_user_creation(editor_user, business):
     assert editor_user.username == "editor"
@@ -162,3 +183,918 @@ def test_chatbot_unauthenticated(api_client):
 
     history_response = api_client.get('/api/chat/history/')
     assert history_response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_public_product_range_filters(api_client, editor_user, business):
+    other_business = Business.objects.create(name="Other Business")
+    Product.objects.create(name="Cheap", price=5.00, status='approved', created_by=editor_user, business=business)
+    Product.objects.create(name="Mid", price=25.00, status='approved', created_by=editor_user, business=business)
+    Product.objects.create(name="Other Mid", price=30.00, status='approved', created_by=editor_user, business=other_business)
+    Product.objects.create(name="Draft Mid", price=25.00, status='draft', created_by=editor_user, business=business)
+
+    response = api_client.get('/api/public/products/', {'price_min': '10', 'price_max': '50', 'business__in': str(business.id)})
+    assert response.status_code == status.HTTP_200_OK
+    assert [p['name'] for p in response.data['results']] == ["Mid"]
+
+    response = api_client.get('/api/public/products/', {'created_after': '2000-01-01', 'created_before': '2999-12-31'})
+    assert response.data['count'] == 3
+
+
+@pytest.mark.django_db
+def test_product_filters_validate_input(api_client, admin_user, editor_user, business):
+    Product.objects.create(name="Draft", price=10.00, status='draft', created_by=editor_user, business=business)
+    Product.objects.create(name="Pending", price=10.00, status='pending_approval', created_by=editor_user, business=business)
+    api_client.force_authenticate(user=admin_user)
+
+    response = api_client.get('/api/products/', {'status__in': 'draft,pending_approval'})
+    assert response.data['count'] == 2
+
+    for params in ({'price_min': 'abc'}, {'status__in': 'bogus'}, {'business__in': 'x'},
+                   {'business__in': '99999999999999999999999'}, {'business__in': f'{business.pk},0'},
+                   {'business__in': '-1'},
+                   {'created_after': 'yesterday'}, {'price_min': '50', 'price_max': '10'}):
+        response = api_client.get('/api/products/', params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(params) & set(response.data)
+
+
+@pytest.mark.django_db
+def test_public_product_sparse_fieldsets(api_client, editor_user, business):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    Product.objects.create(name="Widget", description="Long text", price=12.50, status='approved',
+                           created_by=editor_user, business=business)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get('/api/public/products/', {'fields': 'id,name,price,image'})
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.data['results'][0]) == {'id', 'name', 'price', 'image'}
+    select = queries.captured_queries[-1]['sql']
+    assert 'JOIN' not in select and '"description"' not in select
+
+    response = api_client.get('/api/public/products/', {'exclude': 'description,created_by_username'})
+    result = response.data['results'][0]
+    assert 'description' not in result and 'created_by_username' not in result
+    assert result['business_name'] == "Test Business"
+
+    response = api_client.get('/api/public/products/', {'fields': 'name,bogus'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_public_products_compressed_and_cached(api_client, editor_user, business):
+    import gzip
+    import json
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for i in range(20):
+        Product.objects.create(name=f"Product {i}", description="A fairly descriptive text " * 5,
+                               price=10 + i, status='approved', created_by=editor_user, business=business)
+
+    response = api_client.get('/api/public/products/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='application/json')
+    assert response['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response['Vary']
+    assert json.loads(gzip.decompress(response.content))['count'] == 20
+
+    with CaptureQueriesContext(connection) as queries:
+        cached = api_client.get('/api/public/products/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='application/json')
+    assert len(queries) == 0
+    assert cached.content == response.content
+
+    Product.objects.filter(name="Product 0").first().delete()
+    response = api_client.get('/api/public/products/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='application/json')
+    assert json.loads(gzip.decompress(response.content))['count'] == 19
+
+    # Bulk updates and business renames invalidate the cache too
+    Product.objects.filter(name="Product 1").update(status='draft')
+    response = api_client.get('/api/public/products/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='application/json')
+    assert json.loads(gzip.decompress(response.content))['count'] == 18
+    business.name = "Renamed Business"
+    business.save()
+    response = api_client.get('/api/public/products/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='application/json')
+    assert json.loads(gzip.decompress(response.content))['results'][0]['business_name'] == "Renamed Business"
+
+    response = api_client.get('/api/public/products/', HTTP_ACCEPT_ENCODING='gzip;q=0', HTTP_ACCEPT='application/json')
+    assert not response.has_header('Content-Encoding')
+
+    # HTML pages carry CSRF tokens: gzip only, padded so lengths vary between responses
+    pages = [api_client.get('/login/', HTTP_ACCEPT_ENCODING='br, gzip') for _ in range(5)]
+    assert {page['Content-Encoding'] for page in pages} == {'gzip'}
+    assert b'csrfmiddlewaretoken' in gzip.decompress(pages[0].content)
+    assert len({len(page.content) for page in pages}) > 1
+
+
+@pytest.mark.django_db
+def test_public_products_msgpack(api_client, editor_user, business):
+    msgpack = pytest.importorskip('msgpack')
+    Product.objects.create(name="Packed", price=9.99, status='approved', created_by=editor_user, business=business)
+
+    response = api_client.get('/api/public/products/', HTTP_ACCEPT='application/msgpack')
+    assert response['Content-Type'] == 'application/msgpack'
+    data = msgpack.unpackb(response.content)
+    assert data['results'][0]['name'] == "Packed"
+    assert data['results'][0]['price'] == "9.99"
+
+
+@pytest.mark.django_db
+def test_admin_changelists_scale(client, editor_user, business):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from chatbot.models import ChatMessage
+
+    superuser = User.objects.create_superuser(username="root", password="root123", email="root@example.com")
+    client.force_login(superuser)
+
+    def changelist_queries(url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, params or {})
+        assert response.status_code == 200
+        return response, queries
+
+    def add_rows(count):
+        for i in range(count):
+            other = User.objects.create_user(username=f"staff{User.objects.count()}", business=business)
+            Product.objects.create(name=f"P{i}", price=1, created_by=other, business=business)
+            ChatMessage.objects.create(user=other, user_message="hi", ai_response="hello")
+
+    add_rows(2)
+    _, few_products = changelist_queries('/admin/api/product/')
+    _, few_messages = changelist_queries('/admin/chatbot/chatmessage/')
+    add_rows(8)
+    response, many_products = changelist_queries('/admin/api/product/')
+    _, many_messages = changelist_queries('/admin/chatbot/chatmessage/')
+    assert len(many_products) == len(few_products)
+    assert len(many_messages) == len(few_messages)
+    assert not any('COUNT(' in q['sql'] and '"api_product"' in q['sql'] for q in many_products.captured_queries)
+    assert response.context['cl'].result_count == 10
+
+    response, _ = changelist_queries('/admin/api/product/', {'business': 'Test'})
+    assert response.context['cl'].result_count == 10
+    response, _ = changelist_queries('/admin/api/product/', {'business': 'Nope'})
+    assert response.context['cl'].result_count == 0
+
+
+@pytest.mark.django_db
+def test_chat_prompt_respects_token_budget(editor_user, business):
+    from chatbot.prompts import build_prompt, count_tokens
+
+    for i in range(50):
+        Product.objects.create(name=f"Gadget {i}", description="Filler description text. " * 40,
+                               price=10, status='approved', created_by=editor_user, business=business)
+    Product.objects.create(name="Blue Umbrella", description="Keeps you dry.", price=15,
+                           status='approved', created_by=editor_user, business=business)
+
+    prompt = build_prompt("Do you sell an umbrella? " + "please " * 2000, token_budget=600)
+    assert prompt.token_count == count_tokens(prompt.text)
+    assert prompt.token_count <= 600
+    assert "Blue Umbrella: Keeps you dry." in prompt.text
+    assert prompt.products_included + prompt.products_omitted == 51
+    assert f"({prompt.products_omitted} more products not shown)" in prompt.text
+    assert "Filler description text. " * 40 not in prompt.text
+
+
+@pytest.mark.django_db
+def test_chat_reports_prompt_tokens(api_client, editor_user):
+    api_client.force_authenticate(user=editor_user)
+    response = api_client.post('/api/chat/', {'message': 'Hello'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['prompt_tokens'] > 0
+
+
+@pytest.mark.django_db
+def test_chat_with_stub_backend(api_client, editor_user, settings):
+    from chatbot.backends import get_backend
+
+    settings.CHATBOT = {**settings.CHATBOT, 'BACKEND': 'chatbot.backends.StubBackend', 'BACKEND_OPTIONS': {}}
+    backend = get_backend()
+    assert backend.generate("same prompt") == backend.generate("same prompt")
+    assert ''.join(backend.stream("same prompt")).strip() == backend.generate("same prompt")
+
+    api_client.force_authenticate(user=editor_user)
+    first = api_client.post('/api/chat/', {'message': 'Hello'})
+    second = api_client.post('/api/chat/', {'message': 'Hello'})
+    assert first.data['ai_response'].startswith('[stub ')
+    assert first.data['ai_response'] == second.data['ai_response']
+
+
+@pytest.mark.django_db
+def test_product_change_feed(api_client, admin_user, editor_user, business):
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import ProductChange
+
+    approver = User.objects.create_user(username="approver", password="approver123", business=business, role="approver")
+    viewer = User.objects.create_user(username="viewer", password="viewer123", business=business, role="viewer")
+    other_business = Business.objects.create(name="Other Business")
+    other_editor = User.objects.create_user(username="other", business=other_business, role="editor")
+
+    api_client.force_authenticate(user=editor_user)
+    response = api_client.post('/api/products/', {'name': 'Feed Product', 'price': 10, 'status': 'pending_approval'})
+    product_id = response.data['id']
+    Product.objects.create(name="Elsewhere", price=5, created_by=other_editor, business=other_business)
+
+    api_client.force_authenticate(user=approver)
+    api_client.post(f'/api/products/{product_id}/approve/')
+
+    api_client.force_authenticate(user=editor_user)
+    api_client.patch(f'/api/products/{product_id}/', {'name': 'Renamed'})
+    api_client.delete(f'/api/products/{product_id}/')
+
+    response = api_client.get('/api/products/changes/')
+    assert [c['action'] for c in response.data['results']] == ['created', 'approved', 'updated', 'deleted']
+    assert all(c['product'] == product_id for c in response.data['results'])
+
+    first = api_client.get('/api/products/changes/', {'limit': 2})
+    assert first.data['has_more'] is True
+    rest = api_client.get('/api/products/changes/', {'since': first.data['next']})
+    assert [c['action'] for c in rest.data['results']] == ['updated', 'deleted']
+    assert api_client.get('/api/products/changes/', {'since': rest.data['next']}).data['results'] == []
+
+    api_client.force_authenticate(user=viewer)
+    response = api_client.get('/api/products/changes/')
+    assert [c['action'] for c in response.data['results']] == ['approved', 'updated', 'deleted']
+
+    api_client.force_authenticate(user=admin_user)
+    assert len(api_client.get('/api/products/changes/').data['results']) == 5
+    assert api_client.get('/api/products/changes/', {'since': 'abc'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    # Bulk edits are logged; claims are queue bookkeeping and are not
+    pending = Product.objects.create(name="Bulk", price=5, created_by=editor_user, business=business,
+                                     status='pending_approval')
+    since = api_client.get('/api/products/changes/').data['next']
+    Product.objects.filter(pk=pending.pk).update(claimed_by=approver, claimed_at=timezone.now())
+    Product.objects.filter(pk=pending.pk).update(status='approved')
+    response = api_client.get('/api/products/changes/', {'since': since})
+    assert [(c['action'], c['status']) for c in response.data['results']] == [('approved', 'approved')]
+
+    # A gap in the ids may be a transaction still committing: hold back what follows until it settles
+    since = response.data['next']
+    ProductChange.objects.create(id=int(since) + 2, product_id=pending.pk, business_id=business.pk,
+                                 action='updated', status='approved')
+    assert api_client.get('/api/products/changes/', {'since': since}).data['results'] == []
+    ProductChange.objects.filter(id=int(since) + 2).update(timestamp=timezone.now() - timedelta(minutes=5))
+    assert len(api_client.get('/api/products/changes/', {'since': since}).data['results']) == 1
+
+
+@pytest.mark.django_db
+def test_background_jobs_retry_and_idempotency(django_capture_on_commit_callbacks, monkeypatch):
+    from datetime import timedelta
+    from django.utils import timezone
+    from jobs import queue
+    from jobs.models import Job
+    from jobs.queue import task, enqueue, claim_jobs, execute_job, run_pending, purge_succeeded_jobs
+
+    # Handlers registered here are dropped when the test ends
+    monkeypatch.setattr(queue, '_registry', dict(queue._registry))
+    calls = []
+
+    @task('tests.flaky')
+    def flaky(value):
+        calls.append(value)
+        if len(calls) == 1:
+            raise RuntimeError("transient failure")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        enqueue('tests.flaky', {'value': 1}, idempotency_key='flaky-1')
+        enqueue('tests.flaky', {'value': 1}, idempotency_key='flaky-1')
+    assert Job.objects.count() == 1
+
+    claimed = claim_jobs(batch_size=5, worker_id='a')
+    assert len(claimed) == 1
+    assert claim_jobs(batch_size=5, worker_id='b') == []
+
+    assert execute_job(claimed[0].pk) == 'queued'
+    job = Job.objects.get()
+    assert job.attempts == 1 and 'transient failure' in job.last_error and job.run_at > job.created_at
+
+    Job.objects.update(run_at=job.created_at)
+    assert run_pending() == 1
+    assert Job.objects.get().status == 'succeeded'
+    assert calls == [1, 1]
+
+    # A job whose worker died counts the lost run; a stale worker can't overwrite the new claim's outcome
+    job = queue.create_job('tests.flaky', {'value': 2}, max_attempts=2)
+    stale = claim_jobs(batch_size=5, worker_id='dead')[0]
+    Job.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+    fresh = claim_jobs(batch_size=5, worker_id='live')[0]
+    assert Job.objects.get(pk=job.pk).attempts == 1
+    assert execute_job(stale.pk, stale.claimed_by) is None
+    assert execute_job(fresh.pk, fresh.claimed_by) == 'succeeded'
+    assert Job.objects.get(pk=job.pk).attempts == 2
+    assert calls == [1, 1, 2]
+
+    crashing = queue.create_job('tests.flaky', {'value': 3}, max_attempts=1)
+    claim_jobs(batch_size=5, worker_id='dead')
+    Job.objects.filter(pk=crashing.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+    assert claim_jobs(batch_size=5, worker_id='live') == []
+    assert Job.objects.get(pk=crashing.pk).status == 'failed'
+
+    Job.objects.filter(status='succeeded').update(updated_at=timezone.now() - timedelta(days=2))
+    assert purge_succeeded_jobs() == 2
+    assert list(Job.objects.values_list('status', flat=True)) == ['failed']
+
+
+@pytest.mark.django_db
+def test_product_image_processed_in_background(api_client, editor_user, settings, tmp_path, django_capture_on_commit_callbacks):
+    import io
+    from PIL import Image
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from jobs.models import Job
+    from jobs.queue import run_pending
+
+    settings.MEDIA_ROOT = tmp_path
+    settings.PRODUCT_IMAGE_MAX_SIZE = 100
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 200), 'red').save(buffer, format='PNG')
+    upload = SimpleUploadedFile('big.png', buffer.getvalue(), content_type='image/png')
+
+    api_client.force_authenticate(user=editor_user)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post('/api/products/', {'name': 'Pic', 'price': 5, 'image': upload}, format='multipart')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Job.objects.filter(name='api.optimize_product_image', status='queued').count() == 1
+
+    assert run_pending() == 1
+    product = Product.objects.get()
+    with product.image.open('rb') as image_file:
+        assert Image.open(image_file).size == (100, 50)
+
+
+def test_boot_does_not_import_chat_sdk():
+    import os
+    import subprocess
+    import sys
+    from django.conf import settings
+
+    script = (
+        "import sys, django; django.setup(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns; "
+        "print(sorted(m for m in ('google.genai', 'dotenv', 'PIL.Image') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'product_marketplace.settings'})
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[]'
+
+
+@pytest.mark.django_db(databases='__all__')
+def test_products_spread_across_shards(api_client):
+    from contextlib import ExitStack
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db import connections
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.core.management import call_command
+    from .sharding import shard_for_business
+
+    if len(settings.SHARDS) < 2:
+        pytest.skip('run with MARKETPLACE_SHARDS=2 or more (see test_sharding_with_two_shards)')
+
+    businesses = [Business.objects.create(name=f"Business {i}") for i in range(4)]
+    assert {shard_for_business(b.pk) for b in businesses} == set(settings.SHARDS)
+    approver = User.objects.create_user(username="approver", password="approver123", role="approver")
+    for i, business in enumerate(businesses):
+        editor = User.objects.create_user(username=f"editor{i}", password="editor123", business=business, role="editor")
+        shard = shard_for_business(business.pk)
+        assert User.objects.using(shard).filter(pk=editor.pk).exists()
+        for j in range(3):
+            product = Product.objects.create(name=f"Item {i}-{j}", price=10 * j + i, created_by=editor,
+                                             business=business, status='approved')
+            assert product._state.db == shard
+
+    ids = [p.id for shard in settings.SHARDS for p in Product.objects.using(shard).all()]
+    assert len(ids) == len(set(ids)) == 12
+
+    # Editors stay on their own shard
+    api_client.force_authenticate(user=User.objects.get(username="editor1"))
+    response = api_client.get('/api/products/')
+    assert {p['business'] for p in response.data['results']} == {businesses[1].pk}
+
+    # Public listing merges shards in order and paginates across them
+    api_client.force_authenticate(user=None)
+    response = api_client.get('/api/public/products/?ordering=-price')
+    prices = [float(p['price']) for p in response.data['results']]
+    assert response.data['count'] == 12
+    assert prices == sorted(prices, reverse=True) and prices[0] == 23
+    response = api_client.get('/api/public/products/?ordering=price&page=2')
+    assert [float(p['price']) for p in response.data['results']] == [22, 23]
+
+    # Approvers reach products on any shard by id
+    product = Product.objects.using(shard_for_business(businesses[3].pk)).first()
+    Product.objects.using(product._state.db).filter(pk=product.pk).update(status='pending_approval')
+    api_client.force_authenticate(user=approver)
+    response = api_client.post(f'/api/products/{product.pk}/approve/')
+    assert response.status_code == status.HTTP_200_OK
+
+    # Moving a business carries its products along
+    source = shard_for_business(businesses[1].pk)
+    target = next(shard for shard in settings.SHARDS if shard != source)
+    call_command('rebalance_shards', business=businesses[1].pk, target=target, stdout=StringIO())
+    assert shard_for_business(businesses[1].pk) == target
+    assert Product.objects.using(source).filter(business=businesses[1]).count() == 0
+    assert Product.objects.using(target).filter(business=businesses[1]).count() == 3
+    api_client.force_authenticate(user=User.objects.get(username="editor1"))
+    assert api_client.get('/api/products/').data['count'] == 3
+    # Every process reads placement from the shared cache, so a move is seen at once
+    assert cache.get(f'business-shard:{businesses[1].pk}') == target
+
+    # Sparse fieldsets still load the merge's ordering columns: no query per row
+    api_client.force_authenticate(user=None)
+    with ExitStack() as stack:
+        captured = [stack.enter_context(CaptureQueriesContext(connections[shard])) for shard in settings.SHARDS]
+        response = api_client.get('/api/public/products/?fields=id,name')
+    assert len(response.data['results']) == 10
+    assert sum(len(queries) for queries in captured) <= 2 * len(settings.SHARDS)
+
+    # Admins list products from every shard and open them wherever they live
+    superuser = User.objects.create_superuser(username="root", password="root123", email="root@example.com")
+    client = Client()
+    client.force_login(superuser)
+    response = client.get('/admin/api/product/', {'q': 'Item'})
+    assert response.context['cl'].result_count == 12
+    # Bulk actions run on one shard at a time
+    assert response.context['action_form'] is None
+    response = client.get('/admin/api/product/', {'q': 'Item', 'shard': target})
+    assert response.context['cl'].result_count == Product.objects.using(target).count()
+    moved = Product.objects.using(target).filter(business=businesses[1]).first()
+    assert client.get(f'/admin/api/product/{moved.pk}/change/').status_code == 200
+
+
+def test_sharding_with_two_shards():
+    import subprocess
+    import sys
+    from django.conf import settings
+
+    env = {**os.environ, 'MARKETPLACE_SHARDS': '2'}
+    result = subprocess.run(
+        [sys.executable, '-m', 'pytest', '--ds=product_marketplace.settings', '-q', '-p', 'no:cacheprovider',
+         'api/tests.py', '-k', 'test_products_spread_across_shards'],
+        cwd=settings.BASE_DIR, capture_output=True, text=True, env=env,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert '1 passed' in result.stdout
+
+
+@pytest.mark.django_db
+def test_storefront_pages_cache_product_cards(client, editor_user, business, django_assert_num_queries):
+    product = Product.objects.create(name="Lamp", description="Warm light", price=30, created_by=editor_user,
+                                     business=business, status='approved')
+    Product.objects.create(name="Secret", price=5, created_by=editor_user, business=business, status='draft')
+
+    response = client.get('/shop/')
+    assert response.status_code == status.HTTP_200_OK
+    assert b'Lamp' in response.content and b'Secret' not in response.content
+
+    # Cards come from the cache: only the count and the id/version index are queried
+    with django_assert_num_queries(2):
+        assert b'Lamp' in client.get('/shop/').content
+
+    # Any update moves the version, so the edit shows up straight away
+    Product.objects.filter(pk=product.pk).update(name="Desk Lamp")
+    assert b'Desk Lamp' in client.get('/shop/').content
+    product.refresh_from_db()
+    product.price = 35
+    product.save()
+    detail = client.get(f'/shop/{product.pk}/')
+    assert b'$35.00' in detail.content and b'Desk Lamp' in detail.content and b'Test Business' in detail.content
+
+    draft = Product.objects.get(name="Secret")
+    assert client.get(f'/shop/{draft.pk}/').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db(transaction=True)
+def test_product_events_stream(editor_user, business, settings):
+    import asyncio
+    from asgiref.sync import async_to_sync, sync_to_async
+    from django.test import AsyncClient
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    settings.PRODUCT_EVENTS = {'POLL_INTERVAL': 0.05, 'HEARTBEAT_SECONDS': 0.5}
+    approver = User.objects.create_user(username="approver", password="approver123", role="approver")
+    other_business = Business.objects.create(name="Other Business")
+    other_editor = User.objects.create_user(username="other", password="other123", business=other_business, role="editor")
+    viewer = User.objects.create_user(username="viewer", password="viewer123", business=business, role="viewer")
+    product = Product.objects.create(name="Chair", price=20, created_by=editor_user, business=business)
+
+    def submit_and_approve():
+        product.status = 'pending_approval'
+        product.save()
+        product.status = 'approved'
+        product.save()
+
+    async def run():
+        client = AsyncClient()
+
+        async def open_stream(user, **headers):
+            response = await client.get('/api/products/events/',
+                                        headers={'Authorization': f'Bearer {AccessToken.for_user(user)}', **headers})
+            if response.status_code != 200:
+                return response.status_code
+            assert response['Content-Type'] == 'text/event-stream'
+            stream = response.streaming_content
+            assert (await anext(stream)).startswith(b'retry:')
+            return stream
+
+        assert await open_stream(viewer) == status.HTTP_403_FORBIDDEN
+        approver_stream = await open_stream(approver)
+        editor_stream = await open_stream(editor_user)
+        other_stream = await open_stream(other_editor)
+        await sync_to_async(submit_and_approve)()
+
+        events = [await asyncio.wait_for(anext(stream), 2) for stream in (approver_stream, approver_stream, editor_stream, editor_stream)]
+        heartbeat = await asyncio.wait_for(anext(other_stream), 2)
+
+        # Reconnecting clients replay what they missed
+        resumed = await open_stream(editor_user, **{'Last-Event-ID': '0'})
+        replayed = [await asyncio.wait_for(anext(resumed), 2) for _ in range(3)]
+        for stream in (approver_stream, editor_stream, other_stream, resumed):
+            await stream.aclose()
+        return events, heartbeat, replayed
+
+    events, heartbeat, replayed = async_to_sync(run)()
+    assert [e.split(b'\n')[1] for e in events] == [b'event: submitted', b'event: approved'] * 2
+    assert heartbeat == b': keepalive\n\n'
+    assert [e.split(b'\n')[1] for e in replayed] == [b'event: created', b'event: submitted', b'event: approved']
+
+
+@pytest.mark.django_db
+def test_approval_queue_claims(api_client, editor_user, business, settings):
+    from datetime import timedelta
+    from django.utils import timezone
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from .models import ProductChange
+
+    settings.APPROVAL_QUEUE = {'LEASE_SECONDS': 60}
+    first = User.objects.create_user(username="approver1", password="approver123", role="approver")
+    second = User.objects.create_user(username="approver2", password="approver123", role="approver")
+    for i in range(5):
+        Product.objects.create(name=f"Pending {i}", price=10, created_by=editor_user, business=business,
+                               status='pending_approval')
+
+    api_client.force_authenticate(user=first)
+    with CaptureQueriesContext(connection) as queries:
+        claimed = api_client.post('/api/products/claim/', {'count': 3}, format='json').data
+    # The serializer's creator and business names come with the products, not a query each
+    assert sum('"api_business"' in query['sql'] for query in queries.captured_queries) == 1
+    assert [p['name'] for p in claimed['results']] == ["Pending 0", "Pending 1", "Pending 2"]
+    assert claimed['lease_expires_at'] is not None
+    mine = [p['id'] for p in claimed['results']]
+
+    # Claimed products are hidden from, and cannot be claimed by, other approvers
+    api_client.force_authenticate(user=second)
+    assert [p['name'] for p in api_client.post('/api/products/claim/', {'count': 3}, format='json').data['results']] == ["Pending 3", "Pending 4"]
+    assert api_client.post('/api/products/claim/', {'count': 3}, format='json').data['results'] == []
+    listed = {p['id'] for p in api_client.get('/api/products/?status__in=pending_approval').data['results']}
+    assert not listed & set(mine)
+    assert api_client.post(f'/api/products/{mine[0]}/approve/').status_code == status.HTTP_409_CONFLICT
+    assert Product.objects.get(pk=mine[0]).status == 'pending_approval'
+    assert api_client.post(f'/api/products/{mine[0]}/release/').status_code == status.HTTP_404_NOT_FOUND
+
+    # Approving or releasing hands the product back; an expired lease does too
+    api_client.force_authenticate(user=first)
+    assert api_client.post(f'/api/products/{mine[0]}/approve/').status_code == status.HTTP_200_OK
+    assert api_client.post(f'/api/products/{mine[1]}/release/').status_code == status.HTTP_204_NO_CONTENT
+    Product.objects.filter(pk=mine[2]).update(claimed_at=timezone.now() - timedelta(seconds=61))
+    api_client.force_authenticate(user=second)
+    assert [p['id'] for p in api_client.post('/api/products/claim/', {'count': 5}, format='json').data['results']] == mine[1:]
+    approved = Product.objects.get(pk=mine[0])
+    assert (approved.status, approved.claimed_by) == ('approved', None)
+    assert ProductChange.objects.filter(product_id=mine[0]).latest('id').action == 'approved'
+    assert api_client.post('/api/products/claim/', {'count': 'x'}, format='json').status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_related_products_index(api_client, editor_user, business, django_capture_on_commit_callbacks, settings):
+    from django.core.management import call_command
+    from jobs.queue import run_pending
+
+    catalog = [
+        ("Espresso Machine", "Brews espresso and cappuccino", 300),
+        ("Coffee Grinder", "Burr grinder for espresso beans", 120),
+        ("Desk Lamp", "Adjustable LED lamp", 40),
+        ("Office Chair", "Ergonomic chair with lumbar support", 250),
+        ("Trail Running Shoes", "Lightweight running shoes with grippy soles", 90),
+        ("Road Running Shoes", "Cushioned running shoes for pavement", 110),
+        ("Running Socks", "Breathable socks for running", 12),
+    ]
+    with django_capture_on_commit_callbacks(execute=True):
+        products = [Product.objects.create(name=name, description=description, price=price, created_by=editor_user,
+                                           business=business, status='approved')
+                    for name, description, price in catalog]
+        draft = Product.objects.create(name="Running Shorts", price=30, created_by=editor_user, business=business)
+    run_pending()
+
+    def related(product, **params):
+        response = api_client.get(f'/api/public/products/{product.pk}/related/', params)
+        assert response.status_code == status.HTTP_200_OK
+        return [p['name'] for p in response.json()['results']]
+
+    # Incremental refreshes: shoes relate to shoes first, closer in price beats further
+    assert related(products[4]) == ["Road Running Shoes", "Running Socks"]
+    assert related(products[0]) == ["Coffee Grinder"]
+    assert related(products[4], limit=1) == ["Road Running Shoes"]
+    assert api_client.get(f'/api/public/products/{draft.pk}/related/').status_code == status.HTTP_404_NOT_FOUND
+
+    # Editing or withdrawing a product updates its neighbours
+    with django_capture_on_commit_callbacks(execute=True):
+        products[5].status = 'draft'
+        products[5].save()
+        draft.status = 'approved'
+        draft.save()
+    run_pending()
+    assert related(products[4]) == ["Running Shorts", "Running Socks"]
+    assert related(products[6]) == ["Running Shorts", "Trail Running Shoes"]
+
+    incremental = {p.pk: related(p) for p in products if p.pk != products[5].pk}
+    call_command('rebuild_related_products', stdout=StringIO())
+    assert {p.pk: related(p) for p in products if p.pk != products[5].pk} == incremental
+
+    # Full lists are refilled when a neighbour is withdrawn, from a capped candidate set
+    settings.RELATED_PRODUCTS = {'TOP_K': 1, 'MAX_CANDIDATES': 3}
+    call_command('rebuild_related_products', stdout=StringIO())
+    [nearest] = related(products[4])
+    with django_capture_on_commit_callbacks(execute=True):
+        withdrawn = Product.objects.get(name=nearest)
+        withdrawn.status = 'draft'
+        withdrawn.save()
+    run_pending()
+    assert len(related(products[4])) == 1 and related(products[4]) != [nearest]
+
+    # Bulk updates refresh the index like saves do
+    with django_capture_on_commit_callbacks(execute=True):
+        Product.objects.filter(pk=withdrawn.pk).update(status='approved')
+    run_pending()
+    assert len(related(withdrawn)) == 1
+
+
+@pytest.mark.django_db
+def test_purge_chat_history(editor_user, admin_user, tmp_path):
+    import gzip
+    import json
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from chatbot.models import ChatMessage
+
+    now = timezone.now()
+    for days_ago in (400, 300, 10, 5, 1):
+        message = ChatMessage.objects.create(user=editor_user, user_message=f"{days_ago} days ago", ai_response="ok")
+        ChatMessage.objects.filter(pk=message.pk).update(timestamp=now - timedelta(days=days_ago))
+    for i in range(3):
+        ChatMessage.objects.create(user=admin_user, user_message=f"admin {i}", ai_response="ok")
+
+    out = StringIO()
+    call_command('purge_chat_history', max_age_days=180, max_per_user=2, archive_dir=str(tmp_path),
+                 batch_size=1, pause=0, stdout=out)
+    assert 'Purged 2 messages older than 180 days' in out.getvalue()
+    assert 'Purged 2 messages beyond 2 per user' in out.getvalue()
+    assert sorted(ChatMessage.objects.values_list('user_message', flat=True)) == [
+        "1 days ago", "5 days ago", "admin 1", "admin 2",
+    ]
+
+    [archive] = tmp_path.glob('chat-archive-*.ndjson.gz')
+    with gzip.open(archive, 'rt') as archive_file:
+        archived = [json.loads(line) for line in archive_file]
+    assert [row['user_message'] for row in archived] == ["400 days ago", "300 days ago", "10 days ago", "admin 0"]
+    assert archived[0]['username'] == "editor"
+
+    # Nothing left to purge: no empty archive is written
+    out = StringIO()
+    call_command('purge_chat_history', max_age_days=180, max_per_user=2, archive_dir=str(tmp_path / 'empty'), stdout=out)
+    assert 'Archived to' not in out.getvalue()
+    assert not (tmp_path / 'empty').exists()
+
+
+@pytest.mark.django_db
+def test_request_deadlines(api_client, editor_user, business, settings):
+    import time
+    from django.db import connection
+    from .deadlines import DeadlineExceeded, deadline, get_deadline_metrics
+
+    # A runaway query is cancelled by the database, not left to finish
+    runaway = (
+        "WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) "
+        "SELECT COUNT(*) FROM (SELECT x FROM counter LIMIT 1000000000)"
+    )
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0.05), connection.cursor() as cursor:
+            cursor.execute(runaway)
+    assert time.monotonic() - start < 2
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")  # the connection is usable again
+
+    Product.objects.create(name="Lamp", price=30, created_by=editor_user, business=business, status='approved')
+    settings.REQUEST_DEADLINES = {'VIEWS': {'public-products-list': 0}}
+    response = api_client.get('/api/public/products/')
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response['Retry-After'] == '1'
+    assert get_deadline_metrics() == {'public-products-list': 1}
+    assert api_client.get(f'/api/public/products/{Product.objects.get().pk}/').status_code == status.HTTP_200_OK
+
+
+def test_deadline_guard_lowers_session_timeouts(monkeypatch):
+    from . import deadlines
+
+    class Cursor:
+        description = None
+
+        def __init__(self, statements):
+            self.statements = statements
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+        def execute(self, statement, params):
+            self.statements.append((statement, list(params)))
+            self.description = [('value',)] if statement.startswith('SELECT current_setting') else None
+
+        def fetchone(self):
+            return ['5s']
+
+    class Connection:
+        vendor = 'postgresql'
+
+        def __init__(self):
+            self.statements = []
+            self.connection = self
+
+        def cursor(self):
+            return Cursor(self.statements)
+
+    now = [100.0]
+    monkeypatch.setattr(deadlines.time, 'monotonic', lambda: now[0])
+    connection = Connection()
+    guard = deadlines.DeadlineGuard(connection)
+    token = deadlines._deadline.set(110.0)
+    try:
+        def query():
+            guard(lambda *args: None, 'SELECT 1', (), False, {})
+            return [params for _, params in connection.statements[1:]]
+
+        assert query() == [['10000']]
+        now[0] = 100.1  # within the slack: no round trip
+        assert query() == [['10000']]
+        now[0] = 108.0  # the time left dropped: the timeout follows it down
+        assert query() == [['10000'], ['2000']]
+        guard.reset()
+        assert connection.statements[-1][1] == ['5s']  # the session's own timeout is restored
+    finally:
+        deadlines._deadline.reset(token)
+
+
+def test_deadline_metrics_are_shared_between_processes(tmp_path):
+    import subprocess
+    import sys
+    from django.conf import settings
+
+    (tmp_path / 'deadline_settings.py').write_text(
+        "from product_marketplace.settings import *\n"
+        f"DATABASES = {{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {str(tmp_path / 'db.sqlite3')!r}}}}}\n"
+        "ALLOWED_HOSTS = ['testserver']\n"
+        "REQUEST_DEADLINES = {'VIEWS': {'public-products-list': 0}}\n"
+    )
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'deadline_settings',
+           'PYTHONPATH': os.pathsep.join([str(tmp_path), str(settings.BASE_DIR)])}
+
+    def run(*args):
+        result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, capture_output=True, text=True, env=env)
+        assert result.returncode == 0, result.stdout + result.stderr
+        return result.stdout
+
+    run('manage.py', 'migrate', '-v', '0')
+    run('manage.py', 'createcachetable')
+    # One process serves the cancelled requests, another reports them
+    requests = (
+        "import django; django.setup()\n"
+        "from django.test import Client\n"
+        "print([Client().get('/api/public/products/').status_code for _ in range(2)])\n"
+    )
+    assert run('-c', requests).strip() == '[503, 503]'
+    assert run('manage.py', 'deadline_metrics').split()[-3:] == ['public-products-list', '0', '2']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_requests(api_client, editor_user, business):
+    from chatbot.models import ChatMessage
+
+    Product.objects.create(name="Lamp", price=30, created_by=editor_user, business=business, status='approved')
+    ChatMessage.objects.create(user=editor_user, user_message="Hi", ai_response="Hello")
+    api_client.force_authenticate(user=editor_user)
+
+    requests = [
+        {'id': 'business', 'path': f'/api/businesses/{business.pk}/'},
+        {'id': 'products', 'path': '/api/products/?fields=id,name'},
+        {'id': 'chat', 'path': '/api/chat/history/'},
+        {'id': 'create', 'method': 'POST', 'path': '/api/products/', 'body': {'name': 'Desk', 'price': '80.00'}},
+        {'id': 'after', 'path': '/api/products/?ordering=name&fields=name'},
+        {'id': 'missing', 'path': '/api/products/999999/'},
+        {'id': 'unknown', 'path': '/api/products/nope/extra/'},
+        {'id': 'token', 'method': 'POST', 'path': '/api/token/', 'body': {}},
+        {'id': 'stream', 'path': '/api/products/events/'},
+    ]
+    for parallel in (False, True):
+        response = api_client.post('/api/batch/', {'requests': requests, 'parallel': parallel}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        results = {entry['id']: entry for entry in response.data['responses']}
+        assert [entry['id'] for entry in response.data['responses']] == [item['id'] for item in requests]
+        assert results['business']['body']['name'] == "Test Business"
+        assert results['chat']['status'] == status.HTTP_200_OK
+        assert results['create']['status'] == status.HTTP_201_CREATED
+        assert results['create']['body']['name'] == 'Desk'
+        # The read after a write sees it, even when reads run concurrently
+        names = [item['name'] for item in results['after']['body']['results']]
+        assert names.count('Desk') == (2 if parallel else 1)
+        assert results['missing']['status'] == status.HTTP_404_NOT_FOUND
+        assert results['unknown']['status'] == status.HTTP_404_NOT_FOUND
+        assert results['token']['status'] == status.HTTP_403_FORBIDDEN
+        assert results['stream']['status'] == status.HTTP_403_FORBIDDEN
+    product_names = [item['name'] for item in results['products']['body']['results']]
+    assert 'Lamp' in product_names
+
+    api_client.force_authenticate(user=None)
+    assert api_client.post('/api/batch/', {'requests': requests}, format='json').status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_sub_request_deadlines(api_client, editor_user, business, settings):
+    from .deadlines import get_deadline_metrics
+
+    settings.REQUEST_DEADLINES = {'DEFAULT': 10.0, 'VIEWS': {'batch': 10.0, 'public-products-list': 0}}
+    api_client.force_authenticate(user=editor_user)
+    requests = [
+        {'id': 'slow', 'path': '/api/public/products/'},
+        {'id': 'business', 'path': f'/api/businesses/{business.pk}/'},
+    ]
+    for parallel in (False, True):
+        response = api_client.post('/api/batch/', {'requests': requests, 'parallel': parallel}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert [entry['status'] for entry in response.data['responses']] == [503, 200]
+    assert get_deadline_metrics() == {'public-products-list': 2}
+
+    # Sub-requests never outlast the batch's own budget
+    settings.REQUEST_DEADLINES = {'DEFAULT': 10.0, 'VIEWS': {'batch': 0}}
+    for parallel in (False, True):
+        response = api_client.post('/api/batch/', {'requests': requests, 'parallel': parallel}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert [entry['status'] for entry in response.data['responses']] == [503, 503]
+    assert get_deadline_metrics() == {'public-products-list': 4, 'business-detail': 2}
+
+
+@pytest.mark.django_db
+def test_bulk_user_provisioning(api_client, admin_user, editor_user, business, settings, tmp_path):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.management import call_command
+
+    settings.USER_PROVISIONING = {'WORKERS': 2, 'PARALLEL_THRESHOLD': 2}
+    rows = [
+        {'username': 'ann', 'email': 'ann@example.com', 'password': 'Tr0ub4dor&3x', 'role': 'editor'},
+        {'username': 'bob', 'password': 'Corr3ct-Horse-Battery'},
+        {'username': 'ann', 'password': 'Another-Pass-123'},
+        {'username': 'editor', 'password': 'Taken-Name-123'},
+        {'username': 'cat', 'role': 'owner'},
+        {'username': 'dan', 'password': 'password'},
+        {'username': 'eve'},
+    ]
+
+    api_client.force_authenticate(user=editor_user)
+    assert api_client.post('/api/users/bulk/', rows, format='json').status_code == status.HTTP_403_FORBIDDEN
+
+    api_client.force_authenticate(user=admin_user)
+    response = api_client.post('/api/users/bulk/?dry_run=1', rows, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    assert not User.objects.filter(username='ann').exists()
+
+    response = api_client.post('/api/users/bulk/', {'users': rows}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [user['username'] for user in response.data['created']] == ['ann', 'bob', 'eve']
+    assert [(error['row'], sorted(error['errors'])) for error in response.data['errors']] == [
+        (3, ['username']), (4, ['username']), (5, ['role']), (6, ['password']),
+    ]
+    ann, bob, eve = (User.objects.get(username=name) for name in ('ann', 'bob', 'eve'))
+    assert (ann.business, ann.role, bob.role) == (business, 'editor', 'viewer')
+    assert ann.check_password('Tr0ub4dor&3x') and bob.check_password('Corr3ct-Horse-Battery')
+    assert not eve.has_usable_password()
+
+    upload = SimpleUploadedFile('staff.csv', b'username,email,role,password\nfay,fay@example.com,approver,Sunny-Day-4821\nann,,,\n')
+    response = api_client.post('/api/users/bulk/', {'file': upload}, format='multipart')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert User.objects.get(username='fay').role == 'approver'
+    assert response.data['errors'] == [{'row': 2, 'errors': {'username': ['A user with that username already exists.']}}]
+
+    path = tmp_path / 'staff.json'
+    path.write_text('[{"username": "gus", "password": "Blue-Whale-9931"}, {"username": "hal"}, {"username": "fay"}]')
+    out, err = StringIO(), StringIO()
+    call_command('provision_users', str(path), business=business.pk, role='editor', stdout=out, stderr=err)
+    assert 'Created 2 user(s)' in out.getvalue()
+    assert 'Row 3: username' in err.getvalue()
+    assert User.objects.get(username='gus').role == 'editor'
+    assert User.objects.get(username='gus').check_password('Blue-Whale-9931')
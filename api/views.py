@@ -1,11 +1,90 @@
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import User, Business, Product
-from .serializers import UserSerializer, BusinessSerializer, ProductSerializer
+from django.views.decorators.http import require_GET
+from jobs.queue import enqueue
+from .models import User, Business, Product, ProductChange, RelatedProduct
+from .serializers import UserSerializer, BusinessSerializer, ProductSerializer, ProductChangeSerializer
 from .permissions import IsAdminOrOwner, IsApprover, CanCreateProduct, CanViewAllProducts
+from .filters import ProductFilterBackend
+from .events import can_subscribe, settled, stream_changes
+from .provisioning import ProvisioningError, provision_users, read_rows
+from .approvals import approve_product, claim_products, claimed_by_others, get_approval_setting, lease_expires_at, release_claim
+from .sharding import sharded, shard_for_business
+from .similarity import get_similarity_setting
+
+
+class SparseFieldsetMixin:
+    """
+    Support ``?fields=`` and ``?exclude=`` on read requests.
+
+    The serializer is trimmed to the requested fields and the queryset only
+    loads the columns (and joins) those fields need.
+    """
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        params = self.request.query_params
+        if self.request.method not in SAFE_METHODS or not ('fields' in params or 'exclude' in params):
+            return None
+        available = list(self.get_serializer_class().Meta.fields)
+        selected = available
+        errors = {}
+        for param in ('fields', 'exclude'):
+            if param not in params:
+                continue
+            names = [name.strip() for name in params[param].split(',') if name.strip()]
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                errors[param] = [f'Unknown field(s): {", ".join(unknown)}.']
+            elif param == 'fields':
+                selected = [name for name in selected if name in names]
+            else:
+                selected = [name for name in selected if name not in names]
+        if errors:
+            raise ValidationError(errors)
+        return selected
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_sparse_fields()
+        return context
+
+    def project_queryset(self, queryset):
+        """Apply select_related/only() for the fields that will be serialized."""
+        fields = self.get_sparse_fields()
+        serializer_fields = self.get_serializer_class()(context={'fields': fields}).fields.values()
+        model = queryset.model
+        columns = {model._meta.pk.name}
+        joins = set()
+        projectable = fields is not None
+        for field in serializer_fields:
+            attrs = field.source.split('.')
+            try:
+                model_field = model._meta.get_field(attrs[0])
+            except FieldDoesNotExist:
+                # Computed field: we can't tell which columns it reads, so load them all.
+                projectable = False
+                continue
+            columns.add(model_field.name)
+            if len(attrs) > 1:
+                joins.add('__'.join(attrs[:-1]))
+                columns.add('__'.join(attrs))
+        if joins:
+            queryset = queryset.select_related(*joins)
+        return queryset.only(*columns) if projectable else queryset
 
 
 class BusinessViewSet(viewsets.ModelViewSet):
@@ -35,23 +114,70 @@ class UserViewSet(viewsets.ModelViewSet):
         # Set business to the current user's business
         serializer.save(business=self.request.user.business)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many users of the admin's business at once from a JSON list,
+        ``{"users": [...]}`` or an uploaded CSV/JSON ``file``. Valid rows are
+        created and invalid ones reported by row number. ``?dry_run=1``
+        only validates.
+        """
+        if request.user.role != 'admin':
+            return Response({"detail": "Only business admins can provision users."}, status=status.HTTP_403_FORBIDDEN)
+        if not request.user.business:
+            return Response(
+                {"error": "You must be assigned to a business before provisioning users. Please contact an administrator."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        try:
+            if 'file' in request.FILES:
+                upload = request.FILES['file']
+                rows = read_rows(upload, 'json' if upload.name.endswith('.json') else 'csv')
+            else:
+                rows = request.data if isinstance(request.data, list) else request.data.get('users')
+                if not isinstance(rows, list):
+                    raise ProvisioningError('Send a list of users, {"users": [...]} or a CSV/JSON file.')
+            users, errors = provision_users(rows, request.user.business, dry_run=dry_run)
+        except ProvisioningError as exc:
+            raise ValidationError({'detail': str(exc)})
+        if dry_run:
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_201_CREATED if users else status.HTTP_400_BAD_REQUEST
+        return Response(
+            {'created': UserSerializer(users, many=True).data, 'errors': errors, 'dry_run': dry_run},
+            status=response_status,
+        )
 
-class ProductViewSet(viewsets.ModelViewSet):
+
+class ProductViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, CanCreateProduct]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [ProductFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'created_at', 'status']
 
     def get_queryset(self):
         # Internal view: show products based on permissions
-        if self.request.user.role in ['admin', 'approver']:
-            return Product.objects.all()
-        elif self.request.user.role in ['editor']:
-            return Product.objects.filter(business=self.request.user.business)
+        if self.request.user.role == 'admin':
+            # Fans out across every shard when the catalog is sharded
+            queryset = sharded(Product.objects.all())
+        elif self.request.user.role == 'approver':
+            # Products another approver has claimed stay hidden until the lease ends;
+            # approving one is refused with a conflict instead
+            products = Product.objects.all()
+            if self.action != 'approve':
+                products = products.exclude(claimed_by_others(self.request.user))
+            queryset = sharded(products)
         else:
-            return Product.objects.filter(business=self.request.user.business, status='approved')
+            products = Product.objects.using(shard_for_business(self.request.user.business_id))
+            if self.request.user.role in ['editor']:
+                queryset = products.filter(business=self.request.user.business)
+            else:
+                queryset = products.filter(business=self.request.user.business, status='approved')
+        return self.project_queryset(queryset)
 
     def perform_create(self, serializer):
         if not self.request.user.business:
@@ -59,13 +185,27 @@ class ProductViewSet(viewsets.ModelViewSet):
                 {"error": "You must be assigned to a business before creating products. Please contact an administrator."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        serializer.save(business=self.request.user.business)
+        product = serializer.save(business=self.request.user.business)
+        self.enqueue_post_commit_work(product)
+
+    def perform_update(self, serializer):
+        product = serializer.save()
+        self.enqueue_post_commit_work(product)
+
+    def enqueue_post_commit_work(self, product):
+        # Image processing runs in the job worker, after the transaction commits
+        if 'image' in self.request.FILES and product.image:
+            enqueue(
+                'api.optimize_product_image',
+                {'product_id': product.pk, 'image_name': product.image.name},
+                idempotency_key=f'optimize-image:{product.pk}:{product.image.name}',
+            )
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'changes']:
             # For listing and retrieving, allow based on role
             return [IsAuthenticated()]
-        elif self.action == 'approve':
+        elif self.action in ['approve', 'claim', 'release']:
             return [IsAuthenticated(), IsApprover()]
         else:
             return [IsAuthenticated(), CanCreateProduct(), IsAdminOrOwner()]
@@ -87,16 +227,132 @@ class ProductViewSet(viewsets.ModelViewSet):
         product = self.get_object()
         if product.status != 'pending_approval':
             return Response({"detail": "Product is not pending approval."}, status=status.HTTP_400_BAD_REQUEST)
-        product.status = 'approved'
-        product.save()
+        if not approve_product(request.user, product):
+            return Response(
+                {"detail": "Another approver has claimed this product, or it is no longer pending approval."},
+                status=status.HTTP_409_CONFLICT,
+            )
         serializer = self.get_serializer(product)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsApprover])
+    def claim(self, request):
+        """
+        Claim the next ``count`` pending products for review. Claimed products
+        are hidden from other approvers until approved, released or the lease
+        expires.
+        """
+        try:
+            count = int(request.data.get('count', 10))
+        except (TypeError, ValueError):
+            raise ValidationError({'count': 'Must be an integer.'})
+        if count < 1:
+            raise ValidationError({'count': 'Must be at least 1.'})
+        products = claim_products(request.user, min(count, get_approval_setting('MAX_CLAIM')))
+        return Response({
+            'results': self.get_serializer(products, many=True).data,
+            'lease_expires_at': lease_expires_at(products[0].claimed_at) if products else None,
+        })
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsApprover])
+    def release(self, request, pk=None):
+        product = self.get_object()
+        if not release_claim(request.user, product):
+            return Response({"detail": "You have not claimed this product."}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-class PublicProductViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Incremental change feed: records after ``since``, oldest first, plus
+        the token to pass as ``since`` on the next call.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+        except ValueError:
+            raise ValidationError({'detail': 'since and limit must be integers.'})
+        if since < 0 or limit < 1:
+            raise ValidationError({'detail': 'since must be >= 0 and limit >= 1.'})
+
+        # Changes whose transactions may still be committing are held back until they settle
+        changes = settled(ProductChange.objects.filter(id__gt=since))
+        user = request.user
+        if user.role not in ['admin', 'approver']:
+            changes = changes.filter(business_id=user.business_id)
+            if user.role != 'editor':
+                # Viewers only see approved products, including ones leaving that state
+                changes = changes.filter(Q(status='approved') | Q(previous_status='approved'))
+        page = list(changes.order_by('id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        return Response({
+            'results': ProductChangeSerializer(page, many=True).data,
+            'next': str(page[-1].id if page else since),
+            'has_more': has_more,
+        })
+
+
+class PublicProductViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Product.objects.filter(status='approved')
     serializer_class = ProductSerializer
     permission_classes = []  # No authentication required for public view
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [ProductFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'created_at']
+
+    def get_queryset(self):
+        return self.project_queryset(sharded(super().get_queryset()))
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Most similar approved products, read from the precomputed index."""
+        product = self.get_object()
+        top_k = get_similarity_setting('TOP_K')
+        try:
+            limit = min(int(request.query_params.get('limit', top_k)), top_k)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        if limit < 1:
+            raise ValidationError({'limit': 'Must be at least 1.'})
+
+        related_ids = list(
+            RelatedProduct.objects.filter(product_id=product.pk).order_by('-score')
+            .values_list('related_id', flat=True)[:limit]
+        )
+        # Neighbours withdrawn since the index was refreshed are skipped
+        neighbours = self.project_queryset(sharded(Product.objects.filter(pk__in=related_ids, status='approved')))
+        by_id = {neighbour.pk: neighbour for neighbour in neighbours}
+        ordered = [by_id[related_id] for related_id in related_ids if related_id in by_id]
+        return Response({'results': self.get_serializer(ordered, many=True).data})
+
+
+@require_GET
+async def product_events_view(request):
+    """
+    Server-Sent Events stream of product changes for approvers, admins and
+    editors (their own business only). Must be served by an ASGI server.
+    Authenticate with a JWT ``Authorization`` header or a session cookie.
+    """
+    try:
+        authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    user = authenticated[0] if authenticated else await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+    if not can_subscribe(user):
+        return JsonResponse({'detail': 'You do not have permission to follow product changes.'}, status=status.HTTP_403_FORBIDDEN)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return JsonResponse({'detail': 'Last-Event-ID must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(stream_changes(user, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,11 +1,15 @@
 from django.contrib import admin
+from api.admin_mixins import LargeTableAdminMixin, UserInputFilter
 from .models import ChatMessage
 
 
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'user_message', 'timestamp')
-    list_filter = ('timestamp', 'user')
-    search_fields = ('user__username', 'user_message', 'ai_response')
+    list_filter = (UserInputFilter,)
+    list_select_related = ('user',)
+    date_hierarchy = 'timestamp'
+    # Exact username match uses the unique index; free text over ai_response would scan the table.
+    search_fields = ('=user__username',)
     readonly_fields = ('user', 'user_message', 'ai_response', 'timestamp')
 
     def has_add_permission(self, request):
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_backends = {}
+_env_loaded = False
+
+
+def load_environment():
+    """Load chatbot/.env the first time a backend needs credentials."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(Path(settings.BASE_DIR) / 'chatbot' / '.env')
+        _env_loaded = True
+
+
+def get_backend():
+    """Return the configured chat backend, reusing one instance per configuration."""
+    config = getattr(settings, 'CHATBOT', {})
+    path = config.get('BACKEND', 'chatbot.backends.GeminiBackend')
+    options = config.get('BACKEND_OPTIONS', {})
+    key = (path, tuple(sorted(options.items())))
+    if key not in _backends:
+        _backends[key] = import_string(path)(**options)
+    return _backends[key]
+
+
+class BaseChatBackend:
+    """
+    Interface for the language model behind the chatbot.
+    """
+
+    def generate(self, prompt):
+        """Return the complete response text for a prompt."""
+        raise NotImplementedError('Subclasses must implement generate().')
+
+    def stream(self, prompt):
+        """Yield the response in chunks; backends without streaming yield it whole."""
+        yield self.generate(prompt)
+
+
+class GeminiBackend(BaseChatBackend):
+    """
+    Google Gemini through the google-genai SDK. The SDK is imported and the
+    API key read from GEMINI_API_KEY when the first request is made, so
+    processes that never chat don't pay for either.
+    """
+
+    def __init__(self, model='gemini-2.5-flash'):
+        self.model = model
+        self._client = None
+        self._api_key = None
+
+    def get_client(self):
+        load_environment()
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            return None
+        if self._client is None or api_key != self._api_key:
+            from google import genai
+            self._client = genai.Client(api_key=api_key)
+            self._api_key = api_key
+        return self._client
+
+    def generate(self, prompt):
+        client = self.get_client()
+        if client is None:
+            return "Error: Gemini API key not configured."
+        response = client.models.generate_content(model=self.model, contents=prompt)
+        return response.text
+
+    def stream(self, prompt):
+        client = self.get_client()
+        if client is None:
+            yield "Error: Gemini API key not configured."
+            return
+        for chunk in client.models.generate_content_stream(model=self.model, contents=prompt):
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend(BaseChatBackend):
+    """
+    Deterministic offline backend for tests, profiling and load testing.
+
+    The same prompt always produces the same response. ``latency`` seconds
+    are spent before the first token and ``token_delay`` seconds between
+    streamed tokens, to mimic a real model without network access or API spend.
+    """
+
+    def __init__(self, latency=0.0, token_delay=0.0, response_tokens=40):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.response_tokens = response_tokens
+
+    def tokens(self, prompt):
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        words = f'[stub {digest}] Here are some products that match your question.'.split()
+        for i in range(self.response_tokens):
+            yield words[i % len(words)] + ' '
+
+    def generate(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.token_delay:
+            time.sleep(self.token_delay * self.response_tokens)
+        return ''.join(self.tokens(prompt)).strip()
+
+    def stream(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        for token in self.tokens(prompt):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield token
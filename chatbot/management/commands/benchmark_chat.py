@@ -0,0 +1,88 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from api.benchmarks import benchmark_database, populate_catalog
+from chatbot.models import ChatMessage
+from chatbot.prompts import build_prompt
+from chatbot.serializers import ChatMessageSerializer
+from chatbot.views import chat_view
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark chat_view against the deterministic stub backend in a throwaway database, '
+        'reporting per-phase cost and end-to-end latency under concurrency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500, help='Approved products in the catalog.')
+        parser.add_argument('--requests', type=int, default=400, help='Total chat requests to send.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Worker threads sending requests.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Stub backend latency in seconds.')
+
+    def handle(self, *args, **options):
+        stub = {
+            'BACKEND': 'chatbot.backends.StubBackend',
+            'BACKEND_OPTIONS': {'latency': options['latency']},
+        }
+        with benchmark_database():
+            with override_settings(CHATBOT={**getattr(settings, 'CHATBOT', {}), **stub}):
+                user = populate_catalog(options['products'])
+                self.report_phases(user)
+                self.report_concurrency(user, options['requests'], options['concurrency'], options['latency'])
+
+    def report_phases(self, user, iterations=50):
+        message = 'Which products are under $50?'
+        timings = {'context build': [], 'persistence': [], 'serialization': []}
+        for _ in range(iterations):
+            start = time.perf_counter()
+            prompt = build_prompt(message)
+            timings['context build'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            chat_message = ChatMessage.objects.create(
+                user=user, user_message=message, ai_response='stub', prompt_tokens=prompt.token_count
+            )
+            timings['persistence'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ChatMessageSerializer(chat_message).data
+            timings['serialization'].append(time.perf_counter() - start)
+
+        self.stdout.write('Per-phase cost (mean over %d runs):' % iterations)
+        for phase, samples in timings.items():
+            self.stdout.write(f'  {phase:<15}{statistics.mean(samples) * 1000:>9.3f} ms')
+
+    def report_concurrency(self, user, total, concurrency, latency):
+        factory = APIRequestFactory()
+
+        def send(_):
+            request = factory.post('/api/chat/', {'message': 'Which products are under $50?'}, format='json')
+            force_authenticate(request, user=user)
+            start = time.perf_counter()
+            try:
+                response = chat_view(request)
+            finally:
+                connections.close_all()
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(send, range(total)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(duration for duration, _ in results)
+        errors = sum(1 for _, code in results if code != 201)
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(f'Concurrent chat_view ({total} requests, {concurrency} threads, stub latency {latency * 1000:.0f} ms):')
+        self.stdout.write(f'  throughput     {total / elapsed:>9.1f} req/s')
+        self.stdout.write(
+            f'  p50/p95/p99    {quantiles[49] * 1000:.2f} / {quantiles[94] * 1000:.2f} / {quantiles[98] * 1000:.2f} ms'
+        )
+        self.stdout.write(f'  view overhead  {(statistics.mean(latencies) - latency) * 1000:>9.2f} ms mean')
+        self.stdout.write(f'  errors         {errors:>9d}')
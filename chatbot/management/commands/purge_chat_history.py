@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.retention import ChatArchive, expired_by_age, expired_by_user_cap, get_retention_setting, purge
+
+
+class Command(BaseCommand):
+    help = (
+        'Enforce the chat retention policy: purge messages past the age limit and beyond '
+        'the per-user cap in small batches, optionally archiving them to gzipped NDJSON. '
+        'Safe to run alongside live traffic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=int, default=get_retention_setting('RETENTION_DAYS'),
+                            help='Purge messages older than this. 0 disables the age limit.')
+        parser.add_argument('--max-per-user', type=int, default=get_retention_setting('RETENTION_PER_USER'),
+                            help='Keep only this many newest messages per user. 0 disables the cap.')
+        parser.add_argument('--archive-dir', default=get_retention_setting('ARCHIVE_DIR'),
+                            help='Archive purged messages here before deleting them.')
+        parser.add_argument('--no-archive', action='store_true', help='Delete without archiving.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many messages would be purged.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        rules = []
+        if options['max_age_days']:
+            rules.append((f"older than {options['max_age_days']} days", [expired_by_age(options['max_age_days'])]))
+        if options['max_per_user']:
+            rules.append((f"beyond {options['max_per_user']} per user", expired_by_user_cap(options['max_per_user'])))
+        if not rules:
+            raise CommandError('Both retention limits are disabled; nothing to do.')
+
+        archive = None
+        if options['archive_dir'] and not options['no_archive'] and not options['dry_run']:
+            archive = ChatArchive(options['archive_dir'])
+        try:
+            for label, conditions in rules:
+                purged = sum(
+                    purge(condition, options['batch_size'], options['pause'], archive, options['dry_run'])
+                    for condition in conditions
+                )
+                verb = 'Would purge' if options['dry_run'] else 'Purged'
+                self.stdout.write(f'{verb} {purged} messages {label}')
+        finally:
+            if archive is not None:
+                archive.close()
+                if archive.path is not None:
+                    self.stdout.write(f'Archived to {archive.path}')
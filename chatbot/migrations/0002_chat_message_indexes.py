@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['user', 'timestamp'], name='chat_user_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['timestamp'], name='chat_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_chat_message_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
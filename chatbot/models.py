@@ -8,10 +8,15 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages')
     user_message = models.TextField()
     ai_response = models.TextField()
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='chat_user_timestamp_idx'),
+            models.Index(fields=['timestamp'], name='chat_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"Chat by {self.user.username} at {self.timestamp}"
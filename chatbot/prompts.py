@@ -0,0 +1,137 @@
+import math
+import re
+from collections import namedtuple
+from django.db.models import Q
+from product_marketplace.conf import setting_getter
+from api.models import Product
+from api.sharding import sharded
+
+SYSTEM_INSTRUCTIONS = (
+    "You are a helpful product marketplace assistant. "
+    "Use the following product information to answer questions:"
+)
+CLOSING_INSTRUCTIONS = (
+    "Please provide a helpful, accurate response based on the available products. "
+    "If the user asks about products not in the list, mention that only approved products are shown."
+)
+
+DEFAULTS = {
+    'PROMPT_TOKEN_BUDGET': 4000,
+    'MAX_MESSAGE_TOKENS': 512,
+    'MAX_DESCRIPTION_TOKENS': 60,
+    'MAX_CANDIDATE_PRODUCTS': 200,
+    'CHARS_PER_TOKEN': 4,
+}
+
+get_chatbot_setting = setting_getter('CHATBOT', DEFAULTS)
+
+Prompt = namedtuple('Prompt', ['text', 'token_count', 'products_included', 'products_omitted'])
+
+
+def count_tokens(text):
+    """Approximate token count; tokenizers average roughly four characters per token for English."""
+    return math.ceil(len(text) / get_chatbot_setting('CHARS_PER_TOKEN'))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text on a word boundary so that it fits in max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(max_tokens * get_chatbot_setting('CHARS_PER_TOKEN') - 3, 0)
+    cut = text[:max_chars].rsplit(' ', 1)[0] if ' ' in text[:max_chars] else text[:max_chars]
+    return cut + '...'
+
+
+def search_terms(message):
+    return {term for term in re.findall(r'\w+', message.lower()) if len(term) > 2}
+
+
+def get_candidate_products(user_message):
+    """
+    Approved products worth putting in the prompt: name matches for the
+    message's terms first, then the most recent products.
+    """
+    limit = get_chatbot_setting('MAX_CANDIDATE_PRODUCTS')
+    base = sharded(
+        Product.objects.filter(status='approved')
+        .select_related('business')
+        .only('name', 'description', 'price', 'business__name')
+        .order_by('-created_at')
+    )
+    terms = search_terms(user_message)
+    candidates = {}
+    if terms:
+        query = Q()
+        for term in terms:
+            query |= Q(name__icontains=term)
+        for product in base.filter(query)[:limit]:
+            candidates[product.pk] = product
+    for product in base[:limit]:
+        if len(candidates) >= limit:
+            break
+        candidates.setdefault(product.pk, product)
+    return list(candidates.values())
+
+
+def rank_products(products, user_message):
+    """Order products by how many message terms they mention; names count double."""
+    terms = search_terms(user_message)
+
+    def score(product):
+        name = product.name.lower()
+        description = product.description.lower()
+        return sum(2 * (term in name) + (term in description) for term in terms)
+
+    return sorted(products, key=score, reverse=True)
+
+
+def product_line(product, max_description_tokens=None):
+    if max_description_tokens is None:
+        return f"- {product.name} (${product.price}) by {product.business.name}\n"
+    description = truncate_to_tokens(product.description, max_description_tokens)
+    return f"- {product.name}: {description} (${product.price}) by {product.business.name}\n"
+
+
+def build_prompt(user_message, products=None, token_budget=None):
+    """
+    Build the assistant prompt within a token budget.
+
+    System instructions are always kept, then the user message (truncated to
+    MAX_MESSAGE_TOKENS or half the remaining budget, whichever is smaller),
+    then product context in relevance order. The lowest
+    value content goes first: descriptions are shortened, then products lose
+    their descriptions, then the least relevant products are left out with a
+    note saying how many were omitted.
+    """
+    if token_budget is None:
+        token_budget = get_chatbot_setting('PROMPT_TOKEN_BUDGET')
+    if products is None:
+        products = get_candidate_products(user_message)
+
+    header = f"{SYSTEM_INSTRUCTIONS}\n\nAvailable products:\n"
+    footer_template = "\nUser question: {message}\n\n" + CLOSING_INSTRUCTIONS
+    omission_reserve = count_tokens("(999999 more products not shown)\n")
+    fixed_tokens = count_tokens(header) + count_tokens(footer_template.format(message=''))
+
+    # The message may use at most half of what is left, so product context always gets a share
+    message_budget = min(get_chatbot_setting('MAX_MESSAGE_TOKENS'), max((token_budget - fixed_tokens) // 2, 0))
+    message = truncate_to_tokens(user_message, message_budget)
+    remaining = token_budget - fixed_tokens - count_tokens(message) - omission_reserve
+
+    lines = []
+    description_tokens = get_chatbot_setting('MAX_DESCRIPTION_TOKENS')
+    for product in rank_products(products, user_message):
+        line = product_line(product, description_tokens)
+        if count_tokens(line) > remaining:
+            line = product_line(product)
+            if count_tokens(line) > remaining:
+                break
+        lines.append(line)
+        remaining -= count_tokens(line)
+
+    omitted = len(products) - len(lines)
+    context = ''.join(lines)
+    if omitted:
+        context += f"({omitted} more products not shown)\n"
+    text = header + context + footer_template.format(message=message)
+    return Prompt(text, count_tokens(text), len(lines), omitted)
@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from product_marketplace.conf import setting_getter
+from .models import ChatMessage
+
+DEFAULTS = {
+    # Messages older than this many days are purged; None keeps them
+    'RETENTION_DAYS': 180,
+    # Only the newest messages per user are kept; None keeps them all
+    'RETENTION_PER_USER': 1000,
+    # Purged messages are archived here as gzipped NDJSON; None deletes without archiving
+    'ARCHIVE_DIR': None,
+}
+
+get_retention_setting = setting_getter('CHATBOT', DEFAULTS)
+
+
+def expired_by_age(max_age_days):
+    return Q(timestamp__lt=timezone.now() - timedelta(days=max_age_days))
+
+
+def expired_by_user_cap(max_per_user):
+    """
+    One condition per user over the cap, matching everything older than
+    their ``max_per_user``-th newest message.
+    """
+    over_cap = (
+        ChatMessage.objects.values('user').annotate(total=Count('id'))
+        .filter(total__gt=max_per_user).values_list('user', flat=True)
+    )
+    for user_id in over_cap:
+        timestamp, message_id = (
+            ChatMessage.objects.filter(user_id=user_id).order_by('-timestamp', '-id')
+            .values_list('timestamp', 'id')[max_per_user - 1]
+        )
+        yield Q(user_id=user_id) & (Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+
+
+def serialize(message):
+    return json.dumps({
+        'id': message.id,
+        'user_id': message.user_id,
+        'username': message.user.username,
+        'user_message': message.user_message,
+        'ai_response': message.ai_response,
+        'prompt_tokens': message.prompt_tokens,
+        'timestamp': message.timestamp.isoformat(),
+    }, ensure_ascii=False)
+
+
+class ChatArchive:
+    """
+    Gzipped NDJSON file that purged messages are appended to. Each batch is
+    flushed and synced to disk before its rows are deleted, so an
+    interrupted run can at worst archive a batch twice, never lose it. The
+    file is only created with the first batch; ``path`` stays None until then.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = None
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%S%fZ')
+        self.path = os.path.join(self.directory, f'chat-archive-{stamp}.ndjson.gz')
+        self.raw = open(self.path, 'wb')
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='wb')
+
+    def write(self, messages):
+        if self.path is None:
+            self.open()
+        for message in messages:
+            self.file.write(serialize(message).encode('utf-8') + b'\n')
+        self.file.flush()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        if self.path is not None:
+            self.file.close()
+            self.raw.close()
+
+
+def purge(condition, batch_size=500, pause=0.0, archive=None, dry_run=False):
+    """
+    Delete messages matching ``condition`` oldest first, ``batch_size`` rows
+    per transaction, sleeping ``pause`` seconds between batches so live
+    traffic can get at the table. Returns the number of messages purged.
+    """
+    if dry_run:
+        return ChatMessage.objects.filter(condition).count()
+    purged = 0
+    while True:
+        batch = list(
+            ChatMessage.objects.filter(condition).select_related('user')
+            .order_by('timestamp', 'id')[:batch_size]
+        )
+        if not batch:
+            return purged
+        if archive is not None:
+            archive.write(batch)
+        with transaction.atomic():
+            ChatMessage.objects.filter(id__in=[message.id for message in batch]).delete()
+        purged += len(batch)
+        if pause and len(batch) == batch_size:
+            time.sleep(pause)
@@ -5,8 +5,8 @@ from .models import ChatMessage
 class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
-        fields = ['id', 'user_message', 'ai_response', 'timestamp']
-        read_only_fields = ['id', 'ai_response', 'timestamp']
+        fields = ['id', 'user_message', 'ai_response', 'prompt_tokens', 'timestamp']
+        read_only_fields = ['id', 'ai_response', 'prompt_tokens', 'timestamp']
 
 
 class ChatRequestSerializer(serializers.Serializer):
@@ -1,58 +1,17 @@
-import os
-from pathlib import Path
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from google import genai
-from django.conf import settings
-from dotenv import load_dotenv
-from api.models import Product
 from .models import ChatMessage
 from .serializers import ChatMessageSerializer, ChatRequestSerializer
+from .prompts import build_prompt
+from .backends import get_backend
 
-# Load environment variables
-env_path = Path(settings.BASE_DIR) / 'chatbot' / '.env'
-load_dotenv(env_path)
 
-
-def get_product_context():
-    """Get approved products data for AI context"""
-    products = Product.objects.filter(status='approved').select_related('business')
-    context = "Available products:\n"
-    for product in products:
-        context += f"- {product.name}: {product.description} (${product.price}) by {product.business.name}\n"
-    return context
-
-
-def generate_ai_response(user_message, product_context):
-    """Generate AI response using Gemini API"""
+def generate_ai_response(prompt):
+    """Generate AI response using the configured chat backend"""
     try:
-        
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            return "Error: Gemini API key not configured."
-
-        
-        client = genai.Client(api_key=api_key)
-
-        # The prompt for context to give to LLM
-        prompt = f"""You are a helpful product marketplace assistant. Use the following product information to answer questions:
-
-{product_context}
-
-User question: {user_message}
-
-Please provide a helpful, accurate response based on the available products. If the user asks about products not in the list, mention that only approved products are shown."""
-
-        
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-
-        return response.text
-
+        return get_backend().generate(prompt)
     except Exception as e:
         return f"Error generating AI response: {str(e)}"
 
@@ -67,15 +26,17 @@ def chat_view(request):
 
     user_message = serializer.validated_data['message']
 
-    product_context = get_product_context()
+    # Fit instructions, product context and the message into the token budget
+    prompt = build_prompt(user_message)
 
-    ai_response = generate_ai_response(user_message, product_context)
+    ai_response = generate_ai_response(prompt.text)
 
     # Save the chat message
     chat_message = ChatMessage.objects.create(
         user=request.user,
         user_message=user_message,
-        ai_response=ai_response
+        ai_response=ai_response,
+        prompt_tokens=prompt.token_count
     )
 
     # Return response
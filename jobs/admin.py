@@ -0,0 +1,11 @@
+from django.contrib import admin
+from api.admin_mixins import LargeTableAdminMixin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('=name', '=idempotency_key')
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,64 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from jobs.pool import process_pool
+from jobs.queue import claim_jobs, execute_job, get_jobs_setting, purge_succeeded_jobs
+
+
+# Seconds between sweeps of old succeeded jobs
+PURGE_INTERVAL = 300
+
+
+def _run_in_worker(job_id, claim_id):
+    try:
+        return execute_job(job_id, claim_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs using a thread or process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Pool size.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Use threads for I/O-bound jobs, processes for CPU-bound ones.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed per poll.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle.')
+        parser.add_argument('--once', action='store_true', help='Exit when no jobs are due.')
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        batch_size = options['batch_size'] or max(get_jobs_setting('BATCH_SIZE'), options['workers'])
+        if options['pool'] == 'process':
+            pool = process_pool(options['workers'])
+        else:
+            pool = ThreadPoolExecutor(max_workers=options['workers'])
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        processed = 0
+        last_purge = 0.0
+        try:
+            while not stopping:
+                if time.monotonic() - last_purge >= PURGE_INTERVAL:
+                    purge_succeeded_jobs()
+                    last_purge = time.monotonic()
+                jobs = claim_jobs(batch_size, worker_id)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                statuses = list(pool.map(_run_in_worker, [job.pk for job in jobs], [job.claimed_by for job in jobs]))
+                processed += len(statuses)
+                self.stdout.write(f"Ran {len(statuses)} job(s): {statuses.count('succeeded')} succeeded")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown(wait=True)
+        self.stdout.write(f"Processed {processed} job(s)")
@@ -0,0 +1,18 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import django
+
+
+def process_pool(workers):
+    """
+    A process pool for CPU-bound work. Workers are started by a forkserver,
+    or spawned where that is unavailable (Windows), and run
+    ``django.setup()`` themselves, so they inherit nothing from the caller:
+    no database connections, no locks held by its other threads.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(method),
+        initializer=django.setup,
+    )
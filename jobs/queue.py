@@ -0,0 +1,170 @@
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from product_marketplace.conf import setting_getter
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 10,
+    'BACKOFF_BASE': 2,
+    'BACKOFF_MAX': 600,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 5,
+    # Succeeded jobs are deleted after this many seconds; their idempotency keys go with them
+    'KEEP_SUCCEEDED_SECONDS': 60 * 60 * 24,
+}
+
+get_jobs_setting = setting_getter('JOBS', DEFAULTS)
+
+_registry = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs called ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=0, max_attempts=None):
+    """
+    Queue a job once the current transaction commits, so workers never see
+    jobs for rolled-back changes. Jobs with an idempotency key that already
+    exists are not queued again.
+    """
+    if name not in _registry:
+        raise ValueError(f"Unknown job: {name}")
+    transaction.on_commit(lambda: create_job(name, payload, idempotency_key, delay, max_attempts))
+
+
+def create_job(name, payload=None, idempotency_key=None, delay=0, max_attempts=None):
+    job = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        max_attempts=max_attempts or get_jobs_setting('MAX_ATTEMPTS'),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        return Job.objects.get(idempotency_key=idempotency_key)
+    return job
+
+
+def claim_jobs(batch_size=None, worker_id=None):
+    """
+    Atomically claim up to ``batch_size`` due jobs for one worker.
+
+    Expired leases are returned to the queue first. The claiming UPDATE is
+    conditional on the job still being queued, so concurrent workers never
+    claim the same job even where SELECT ... FOR UPDATE is unavailable.
+    """
+    batch_size = batch_size or get_jobs_setting('BATCH_SIZE')
+    claim_id = f"{uuid.uuid4().hex}:{worker_id or 'worker'}"[:64]
+    now = timezone.now()
+    expire_leases(now)
+
+    with transaction.atomic():
+        due = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=now)
+            .order_by('run_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        Job.objects.filter(id__in=list(due), status='queued').update(
+            status='running', claimed_by=claim_id, claimed_at=now
+        )
+    return list(Job.objects.filter(claimed_by=claim_id, status='running'))
+
+
+def expire_leases(now=None):
+    """
+    Return jobs whose worker held them past the lease to the queue. The lost
+    run counts as an attempt, so a job that keeps killing its worker ends up
+    failed instead of being retried forever.
+    """
+    now = now or timezone.now()
+    expired = Job.objects.filter(status='running', claimed_at__lt=now - timedelta(seconds=get_jobs_setting('LEASE_SECONDS')))
+    lost = 'Lease expired before the job finished; the worker may have died.'
+    expired.filter(attempts__gte=F('max_attempts') - 1).update(
+        status='failed', claimed_by='', attempts=F('attempts') + 1, last_error=lost, updated_at=now
+    )
+    expired.update(status='queued', claimed_by='', attempts=F('attempts') + 1, last_error=lost, updated_at=now)
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter, capped at BACKOFF_MAX."""
+    delay = min(get_jobs_setting('BACKOFF_BASE') ** attempts, get_jobs_setting('BACKOFF_MAX'))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def execute_job(job_id, claim_id=None):
+    """
+    Run one claimed job and record the outcome. Returns the final status, or
+    None if the job's lease was lost to another worker, whose result wins.
+    """
+    job = Job.objects.get(pk=job_id)
+    claim_id = claim_id or job.claimed_by
+    if job.status != 'running' or job.claimed_by != claim_id:
+        logger.warning("Job %s is no longer claimed by %s; skipping it", job, claim_id)
+        return None
+    handler = _registry.get(job.name)
+    job.attempts += 1
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {job.name!r}")
+        handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error("Job %s failed permanently", job, exc_info=True)
+        else:
+            job.status = 'queued'
+            job.run_at = timezone.now() + timedelta(seconds=backoff_seconds(job.attempts))
+            logger.warning("Job %s failed, retrying at %s", job, job.run_at, exc_info=True)
+    else:
+        job.status = 'succeeded'
+        job.last_error = ''
+    # Only record the outcome while still holding the claim
+    recorded = Job.objects.filter(pk=job.pk, status='running', claimed_by=claim_id).update(
+        status=job.status, attempts=job.attempts, run_at=job.run_at, last_error=job.last_error,
+        claimed_by='', updated_at=timezone.now(),
+    )
+    if not recorded:
+        logger.warning("Job %s lost its lease while running; its outcome was discarded", job)
+        return None
+    return job.status
+
+
+def purge_succeeded_jobs(older_than=None):
+    """Delete jobs that succeeded more than ``older_than`` seconds ago. Returns the number deleted."""
+    if older_than is None:
+        older_than = get_jobs_setting('KEEP_SUCCEEDED_SECONDS')
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status='succeeded', updated_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending(batch_size=None):
+    """Claim and run due jobs in the current thread until none are left."""
+    processed = 0
+    while True:
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            return processed
+        for job in jobs:
+            execute_job(job.pk, job.claimed_by)
+            processed += 1
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+
+def setting_getter(setting, defaults):
+    """
+    Return a function reading one key of the ``setting`` dict in Django
+    settings, falling back to ``defaults`` for keys the project leaves out.
+    """
+    def get_setting(name):
+        return getattr(settings, setting, {}).get(name, defaults[name])
+    return get_setting
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,10 +43,14 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'api',
     'chatbot',
+    'jobs',
+    'storefront',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',
+    'api.deadlines.DeadlineMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +89,37 @@ DATABASES = {
     }
 }
 
+# A cache shared by every web and job worker process. Catalog versions, shard
+# placement and cached responses are invalidated through it, so a per-process
+# cache such as LocMemCache would leave the other processes serving stale data.
+# Set REDIS_URL to use Redis; otherwise the cache is the database table created
+# by `python manage.py createcachetable`.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# Business sharding: MARKETPLACE_SHARDS=N adds shard_1..shard_{N-1} next to
+# 'default'. Each business's products (and copies of its users) live on one shard.
+SHARD_COUNT = int(os.environ.get('MARKETPLACE_SHARDS', '1'))
+for shard_index in range(1, SHARD_COUNT):
+    DATABASES[f'shard_{shard_index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard_{shard_index}.sqlite3',
+    }
+SHARDS = ['default'] + [f'shard_{shard_index}' for shard_index in range(1, SHARD_COUNT)]
+DATABASE_ROUTERS = ['api.sharding.BusinessShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,6 +170,7 @@ AUTH_USER_MODEL = 'api.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'api.authentication.BatchSubRequestAuthentication',  # Sub-requests of /api/batch/ act as the batch's user
         'rest_framework.authentication.SessionAuthentication',  # For browsable API
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
@@ -151,6 +189,123 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['rest_framework.filters.SearchFilter', 'rest_framework.filters.OrderingFilter'],
 }
 
+# MessagePack is optional; offer it via content negotiation only when installed
+if importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] += ('api.renderers.MessagePackRenderer',)
+
+# Response compression (gzip, plus brotli when installed)
+API_COMPRESSION = {
+    'MIN_LENGTH': 200,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    # Anonymous GETs under these paths are cached already compressed, keyed on
+    # the catalog version in the shared cache (see CACHES)
+    'CACHE_PATHS': ['/api/public/'],
+    'CACHE_TIMEOUT': 300,
+}
+
+# Chatbot prompt sizing (tokens are estimated at CHARS_PER_TOKEN characters each)
+CHATBOT = {
+    # Use 'chatbot.backends.StubBackend' to run offline with deterministic responses
+    'BACKEND': 'chatbot.backends.GeminiBackend',
+    'BACKEND_OPTIONS': {'model': 'gemini-2.5-flash'},
+    'PROMPT_TOKEN_BUDGET': 4000,
+    'MAX_MESSAGE_TOKENS': 512,
+    'MAX_DESCRIPTION_TOKENS': 60,
+    'MAX_CANDIDATE_PRODUCTS': 200,
+    # Retention, enforced by `manage.py purge_chat_history`
+    'RETENTION_DAYS': 180,
+    'RETENTION_PER_USER': 1000,
+    # Archives hold users' chat transcripts, so they are kept outside the source tree
+    'ARCHIVE_DIR': Path(os.environ.get('CHAT_ARCHIVE_DIR', Path.home() / 'product_marketplace' / 'chat_archive')),
+}
+
+# Background jobs (run with `python manage.py runjobs`)
+JOBS = {
+    'BATCH_SIZE': 10,
+    'BACKOFF_BASE': 2,
+    'BACKOFF_MAX': 600,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 5,
+    # runjobs deletes succeeded jobs after a day
+    'KEEP_SUCCEEDED_SECONDS': 60 * 60 * 24,
+}
+
+STOREFRONT = {
+    'PAGE_SIZE': 24,
+    # Product card fragments are keyed on the product's updated_at, so edits never serve stale cards
+    'CARD_TIMEOUT': 60 * 60 * 24,
+}
+
+PRODUCT_EVENTS = {
+    # Each process polls the change log once per interval and fans changes out to its SSE clients
+    'POLL_INTERVAL': 1.0,
+    'HEARTBEAT_SECONDS': 15,
+    'QUEUE_SIZE': 256,
+    'REPLAY_LIMIT': 1000,
+}
+
+APPROVAL_QUEUE = {
+    # Claimed products return to the queue if not approved or released within the lease
+    'LEASE_SECONDS': 600,
+    'MAX_CLAIM': 50,
+    'CLAIM_ATTEMPTS': 3,
+}
+
+RELATED_PRODUCTS = {
+    'TOP_K': 10,
+    # Share of the score from TF-IDF text similarity; the rest comes from price proximity
+    'TEXT_WEIGHT': 0.8,
+    'NAME_WEIGHT': 2,
+    'MAX_DOCUMENT_FREQUENCY': 0.5,
+    # Incremental refreshes score at most this many products, those sharing the most terms
+    'MAX_CANDIDATES': 500,
+}
+
+REQUEST_DEADLINES = {
+    # Wall-clock seconds a request may run before its database work is cancelled with a 503
+    'DEFAULT': 10.0,
+    'VIEWS': {
+        'product-list': 3.0,
+        'product-detail': 3.0,
+        'public-products-list': 2.0,
+        'public-products-detail': 2.0,
+        'public-products-related': 1.0,
+        'storefront-catalog': 2.0,
+        # Waits on the language model, not the database
+        'chat': 30.0,
+        # Most of the time goes to password hashing in a process pool
+        'user-bulk': 120.0,
+        # Long-lived stream; its queries run after the response starts
+        'product-events': None,
+        # The whole batch; each sub-request also gets its own view's budget, within this
+        'batch': 30.0,
+    },
+    'STATUS_CODE': 503,
+    'RETRY_AFTER': 1,
+    # PostgreSQL/MySQL queries may overrun the deadline by at most this many seconds
+    'TIMEOUT_SLACK': 0.25,
+}
+
+USER_PROVISIONING = {
+    # Rows accepted per provisioning call
+    'MAX_ROWS': 5000,
+    # Password hashing processes; None uses one per core, up to MAX_WORKERS
+    'WORKERS': None,
+    # Every web process keeps its hashing processes alive between requests
+    'MAX_WORKERS': 4,
+}
+
+API_BATCH = {
+    # Sub-requests per /api/batch/ call
+    'MAX_REQUESTS': 20,
+    # Threads running GET sub-requests when a batch asks for "parallel"
+    'MAX_WORKERS': 4,
+}
+
+# Uploaded product images are downscaled to fit within this many pixels
+PRODUCT_IMAGE_MAX_SIZE = 1600
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
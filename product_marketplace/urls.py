@@ -20,7 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from api.views import BusinessViewSet, UserViewSet, ProductViewSet, PublicProductViewSet
+from api.batch import BatchView
+from api.views import BusinessViewSet, UserViewSet, ProductViewSet, PublicProductViewSet, product_events_view
 from .views import login_view, logout_view, dashboard_view
 
 router = DefaultRouter()
@@ -31,10 +32,14 @@ router.register(r'public/products', PublicProductViewSet, basename='public-produ
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Before the router, which would read "events" as a product id
+    path('api/products/events/', product_events_view, name='product-events'),
+    path('api/batch/', BatchView.as_view(), name='batch'),
     path('api/', include(router.urls)),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include('chatbot.urls')),
+    path('shop/', include('storefront.urls')),
 
     # Web views
     path('', dashboard_view, name='dashboard'),
@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from product_marketplace.conf import setting_getter
+from api.models import Product
+from api.sharding import sharded
+
+DEFAULTS = {
+    'PAGE_SIZE': 24,
+    'CARD_TIMEOUT': 60 * 60 * 24,
+}
+
+get_storefront_setting = setting_getter('STOREFRONT', DEFAULTS)
+
+# Fields a catalog page loads per product; everything else comes from the card cache
+INDEX_FIELDS = ('id', 'updated_at', 'created_at')
+
+
+def card_key(product):
+    """Cache key for a product card, versioned by the product's last modification."""
+    return f'storefront:card:{product.pk}:{product.updated_at.timestamp():.6f}'
+
+
+def render_cards(products):
+    """
+    Return rendered cards for ``products`` in order.
+
+    ``products`` only need ``id`` and ``updated_at`` loaded. Cards are read
+    with one cache round-trip; the misses are loaded in a single query,
+    rendered and stored for the next page view.
+    """
+    keys = {product.pk: card_key(product) for product in products}
+    cards = cache.get_many(list(keys.values()))
+    missing = [pk for pk, key in keys.items() if key not in cards]
+    if missing:
+        rendered = {}
+        for product in sharded(Product.objects.filter(pk__in=missing, status='approved')):
+            card = render_to_string('storefront/product_card.html', {'product': product})
+            rendered[card_key(product)] = card
+            # Serve this render even if the row changed since the index query
+            cards[keys[product.pk]] = card
+        cache.set_many(rendered, get_storefront_setting('CARD_TIMEOUT'))
+    # Products deleted or withdrawn between the two queries are left out
+    return [mark_safe(cards[keys[product.pk]]) for product in products if keys[product.pk] in cards]
@@ -0,0 +1,62 @@
+import statistics
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from api.benchmarks import benchmark_database, populate_catalog
+from api.models import Product
+from storefront.cards import get_storefront_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark server-rendered storefront pages in a throwaway database, comparing '
+        'cold renders against renders assembled from cached product cards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Approved products in the catalog.')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per scenario.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            try:
+                populate_catalog(options['products'])
+                self.report(list(Product.objects.values_list('pk', flat=True)), options['iterations'])
+            finally:
+                cache.clear()
+
+    def report(self, product_ids, iterations):
+        last_page = (len(product_ids) - 1) // get_storefront_setting('PAGE_SIZE') + 1
+        scenarios = [
+            ('catalog page 1', '/shop/'),
+            (f'catalog page {last_page}', f'/shop/?page={last_page}'),
+            ('product detail', f'/shop/{product_ids[len(product_ids) // 2]}/'),
+        ]
+        self.stdout.write(f'{"page":<22}{"cache":<7}{"mean ms":>10}{"p95 ms":>10}{"queries":>9}')
+        for label, url in scenarios:
+            for warm in (False, True):
+                samples, queries = self.measure(url, iterations, warm)
+                p95 = statistics.quantiles(samples, n=20)[18] if len(samples) > 1 else samples[0]
+                self.stdout.write(
+                    f'{label:<22}{"warm" if warm else "cold":<7}{statistics.mean(samples) * 1000:>10.2f}'
+                    f'{p95 * 1000:>10.2f}{queries:>9d}'
+                )
+
+    def measure(self, url, iterations, warm):
+        client = Client()
+        cache.clear()
+        if warm:
+            client.get(url)
+        samples = []
+        for _ in range(iterations):
+            if not warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        return samples, len(queries)
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.catalog_view, name='storefront-catalog'),
+    path('<int:pk>/', views.product_detail_view, name='storefront-product'),
+]
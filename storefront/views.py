@@ -0,0 +1,28 @@
+from django.core.paginator import Paginator
+from django.http import Http404
+from django.shortcuts import render
+from api.models import Product
+from api.sharding import sharded
+from .cards import INDEX_FIELDS, get_storefront_setting, render_cards
+
+
+def catalog_view(request):
+    """Server-rendered catalog of approved products, newest first."""
+    products = sharded(Product.objects.filter(status='approved').only(*INDEX_FIELDS)).order_by('-created_at')
+    page = Paginator(products, get_storefront_setting('PAGE_SIZE')).get_page(request.GET.get('page'))
+    return render(request, 'storefront/catalog.html', {
+        'page': page,
+        'cards': render_cards(list(page.object_list)),
+    })
+
+
+def product_detail_view(request, pk):
+    """Server-rendered page for one approved product."""
+    try:
+        product = sharded(Product.objects.filter(status='approved').select_related('business')).get(pk=pk)
+    except Product.DoesNotExist:
+        raise Http404('Product not found')
+    return render(request, 'storefront/product_detail.html', {
+        'product': product,
+        'fragment_timeout': get_storefront_setting('CARD_TIMEOUT'),
+    })